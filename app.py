@@ -5,56 +5,97 @@
 """
 
 import os
+import threading
+from typing import Iterator
+
 import gradio as gr
 
-from poem.config import read_configs
-from poem.generator import PoemGenerator
+from poem import metrics
+from poem.config import load_tokenizer, read_config_dicts
+from poem.genre import Genre
+from poem.serving import MAX_BATCH_SIZE, Serving
 
-# -------- 读取配置与构造生成器 --------
-poem_configs = read_configs()
-if not poem_configs:
-    raise RuntimeError("未读取到任何体裁配置，请检查 read_configs() 返回值。")
+CONFIG_PATH = "poem_config.json"
+# 工作进程数：0 表示在本进程内生成；大于 0 时由多个工作进程生成（见 poem/worker_pool.py），
+# 每个工作进程最多同时处理 POEM_WORKER_CONCURRENCY 个请求（默认与 POEM_MAX_BATCH_SIZE 相同）
+NUM_WORKERS = int(os.environ.get("POEM_WORKERS", "0"))
+WORKER_CONCURRENCY = int(os.environ.get("POEM_WORKER_CONCURRENCY", str(MAX_BATCH_SIZE)))
+# 指标采集由 POEM_METRICS 控制（默认开启，见 poem/metrics.py）；开启时在 /metrics 提供 Prometheus 文本格式的指标
+METRICS_PATH = "/metrics"
+# 就绪检查：启动预热（POEM_WARMUP，见 poem/serving.py）完成后返回 200
+HEALTH_PATH = "/healthz"
+# 单次请求最多生成的候选诗数量
+MAX_NUM_SAMPLES = 8
+# 束搜索的最大束宽
+MAX_BEAM_WIDTH = 16
 
-poem_generators = [
-    PoemGenerator(
-        genre=cfg.genre,
-        vectorization_model=cfg.vectorization_model,
-        generation_model=cfg.generation_model,
-    )
-    for cfg in poem_configs
-]
+# -------- 读取配置（模型在首次使用时才加载） --------
+config_dicts = read_config_dicts(CONFIG_PATH)
+if not config_dicts:
+    raise RuntimeError("未读取到任何体裁配置，请检查 poem_config.json。")
 
-# 体裁名列表 & 索引映射（poem_configs[i].genre.genre 即体裁名）
-GENRE_NAMES = [cfg.genre.genre_name for cfg in poem_configs]
-GENRE_TO_INDEX = {name: i for i, name in enumerate(GENRE_NAMES)}
+# -------- 指标：缓存命中与队列深度在抓取时读取 --------
+def collect_serving_metrics() -> list:
+    caches = [(name, cache) for name, cache in (("result", serving.result_cache), ("prefix", serving.prefix_cache))
+              if cache is not None]
+    samples = []
+    for counter in ("hits", "misses", "evictions"):
+        samples.append((f"poem_cache_{counter}_total", "counter", f"Cache {counter}",
+                        [({"cache": name}, cache.stats()[counter]) for name, cache in caches]))
+    samples.append(("poem_cache_bytes", "gauge", "Cache size in bytes",
+                    [({"cache": name}, cache.stats()["bytes"]) for name, cache in caches]))
+    samples.append(("poem_queue_depth", "gauge", "Requests waiting in the batch queue",
+                    [({"genre": name}, scheduler.queue_depth())
+                     for name, scheduler in serving.generators.resident_items()]))
+    return samples
 
-# --------（可选）一致性校验：每个体裁的模型输出维度应等于其词表大小 --------
-for cfg in poem_configs:
-    tv = cfg.vectorization_model
-    vocab_size = len(tv.get_vocabulary())
-    out_dim = cfg.generation_model.output_shape[-1]
-    if out_dim != vocab_size:
-        raise ValueError(
-            f"体裁“{cfg.genre.genre_name}”的模型输出维度({out_dim})与词表大小({vocab_size})不一致，请检查该体裁的配置。"
-        )
+# 多进程模式下生成相关的指标留在各工作进程内，前端只报告等待与处理中的请求数
+def collect_worker_pool_metrics() -> list:
+    return [
+        ("poem_worker_queue_depth", "gauge", "Requests waiting for a free worker slot", [({}, serving.queue_depth())]),
+        ("poem_worker_in_flight", "gauge", "Requests being served by the workers", [({}, serving.in_flight())]),
+    ]
+
+if NUM_WORKERS > 0:
+    from poem.worker_pool import WorkerPool
+    serving = WorkerPool(CONFIG_PATH, NUM_WORKERS, concurrency=WORKER_CONCURRENCY)
+    if metrics.ENABLED:
+        metrics.REGISTRY.add_collector(collect_worker_pool_metrics)
+else:
+    serving = Serving(config_dicts)
+    if metrics.ENABLED:
+        metrics.REGISTRY.add_collector(collect_serving_metrics)
+
+# 体裁名列表 & 索引映射（config_dicts[i]['genre'] 即体裁枚举名）
+GENRE_NAMES = [Genre[cfg['genre']].genre_name for cfg in config_dicts]
+GENRE_TO_INDEX = {name: i for i, name in enumerate(GENRE_NAMES)}
 
 # -------- 生成与格式化（根据体裁名选择对应生成器） --------
-def generate_and_format_ui(prompt: str, temperature: float, genre_name: str) -> str:
+def generate_and_format_ui(prompt: str, temperature: float, genre_name: str,
+                           num_samples: int = 1, random_seed: float | None = None,
+                           decoding: str = "sample", beam_width: int = 4) -> Iterator[str]:
+    """
+    逐步产出生成中的诗句（流式输出），最后一项为完整结果
+    """
     prompt = (prompt or "").strip()
     if not prompt:
-        return "⚠️ 请至少输入一个起始字。"
+        yield "⚠️ 请至少输入一个起始字。"
+        return
     idx = GENRE_TO_INDEX.get(genre_name, 0)
-    generator = poem_generators[idx]
-    return generator.generate_and_format(prompt, temperature)
+    num_samples = max(1, min(int(num_samples or 1), MAX_NUM_SAMPLES))
+    random_seed = int(random_seed) if random_seed is not None else None
+    beam_width = max(1, min(int(beam_width or 1), MAX_BEAM_WIDTH))
+    yield from serving.stream(config_dicts[idx]['genre'], prompt, temperature, num_samples=num_samples,
+                              seed=random_seed, decoding=decoding, beam_width=beam_width)
 
 def footer_for_genre(genre_name: str) -> str:
     idx = GENRE_TO_INDEX.get(genre_name, 0)
-    config = poem_configs[idx]
+    config = config_dicts[idx]
 
-    genre = poem_configs[idx].genre
-    model_path = config.meta.get('model_path', 'N/A')
-    vocabulary_path = config.meta.get('vocabulary_path', 'N/A')
-    vocabulary_size = len(config.vectorization_model.get_vocabulary())
+    genre = Genre[config['genre']]
+    model_path = config.get('model_path', 'N/A')
+    vocabulary_path = config.get('vocabulary_path', 'N/A')
+    vocabulary_size = load_tokenizer(vocabulary_path).vocabulary_size
     return f"**当前体裁**：`{genre.genre_name}` ｜ **行数**：{genre.rows} ｜ **每行字数**：{genre.cols} ｜ **模型文件**：`{model_path}` ｜ **词表文件**：`{vocabulary_path}` ｜ **词表大小**：{vocabulary_size}"
 
 # -------- Gradio UI --------
@@ -73,15 +114,21 @@ with gr.Blocks(title="诗歌生成") as demo:
         seed = gr.Textbox(label="前置提示词（至少 1 个字）", placeholder="例如：海外", lines=1, scale=3)
     with gr.Row():
         temp = gr.Slider(0, 2.0, value=0.5, step=0.05, label="温度（0=贪心）")
+        num_samples = gr.Slider(1, MAX_NUM_SAMPLES, value=1, step=1, label="候选数量")
+        random_seed = gr.Number(value=None, precision=0, label="随机种子（留空为随机）")
+    with gr.Row():
+        decoding = gr.Radio(choices=[("温度采样", "sample"), ("束搜索", "beam")], value="sample", label="解码方式")
+        beam_width = gr.Slider(1, MAX_BEAM_WIDTH, value=4, step=1, label="束宽（仅束搜索）")
     btn = gr.Button("📝 生成")
-    output = gr.Textbox(label="生成结果", lines=6)
+    output = gr.Textbox(label="生成结果", lines=6, max_lines=48)
 
-    # 点击生成时，将体裁名一并传入
+    # 点击生成时，将体裁名一并传入；不限制并发，以便微批处理合并同时到达的请求
     btn.click(
         fn=generate_and_format_ui,
-        inputs=[seed, temp, genre_dd],
+        inputs=[seed, temp, genre_dd, num_samples, random_seed, decoding, beam_width],
         outputs=[output],
         api_name="generate",
+        concurrency_limit=None,
     )
 
     with gr.Row():
@@ -90,6 +137,35 @@ with gr.Blocks(title="诗歌生成") as demo:
     genre_dd.change(fn=footer_for_genre, inputs=genre_dd, outputs=footer_md)
     demo.load(fn=footer_for_genre, inputs=genre_dd, outputs=footer_md)
 
+# -------- 启动预热与就绪检查 --------
+ready = threading.Event()
+
+def warm_up():
+    # 在本进程内加载并预热各体裁后才报告就绪；多进程模式下各工作进程在启动时已完成预热（WorkerPool 创建完成即就绪）
+    if isinstance(serving, Serving):
+        serving.warm_up()
+    ready.set()
+
 if __name__ == "__main__":
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
     port = int(os.environ.get("GRADIO_PORT", "7860"))
-    demo.launch(server_name="0.0.0.0", server_port=port, share=False)
+    # 就绪检查与指标路由和 Gradio 挂在同一个 FastAPI 应用上；预热完成前 /healthz 返回 503
+    server = FastAPI()
+
+    @server.get(HEALTH_PATH)
+    def health_endpoint():
+        if ready.is_set():
+            return JSONResponse({"status": "ready"})
+        return JSONResponse({"status": "warming up"}, status_code=503)
+
+    if metrics.ENABLED:
+        @server.get(METRICS_PATH, response_class=PlainTextResponse)
+        def metrics_endpoint():
+            return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    server = gr.mount_gradio_app(server, demo, path="/")
+    uvicorn.run(server, host="0.0.0.0", port=port)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Beam search latency against beam width
+
+Loads one genre from poem_config.json (or a synthetic model with `--synthetic`) and
+times PoemGenerator.beam_search for a range of beam widths. All beams advance as one batched decoder step, so latency should grow
+much more slowly than the width.
+
+Run:
+  python -m benchmarks.beam_search -g WUJUE
+  python -m benchmarks.beam_search -g QILV --widths 1 4 16 --repeats 5
+  python -m benchmarks.beam_search -g QILV --synthetic
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_model
+from poem.config import PoemConfig, read_config_dicts
+from poem.generator import PoemGenerator
+from poem.genre import Genre
+
+
+def time_beam_search(generator: PoemGenerator, prompt: str, beam_width: int, repeats: int) -> list[float]:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.beam_search(prompt, beam_width)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="束搜索延迟随束宽变化的基准测试")
+    parser.add_argument("-c", "--config", default="poem_config.json", help="配置文件（默认 poem_config.json）")
+    parser.add_argument("-g", "--genre", default="WUJUE", help="体裁枚举名（默认 WUJUE）")
+    parser.add_argument("--prompt", default="春风", help="前置提示词（默认 春风）")
+    parser.add_argument("--widths", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="要测试的束宽")
+    parser.add_argument("--repeats", type=int, default=10, help="每个束宽的重复次数（默认 10）")
+    parser.add_argument("--synthetic", action="store_true", help="使用随机权重的合成模型（NumPy 后端）")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        genre = Genre[args.genre]
+        with tempfile.TemporaryDirectory() as work_dir:
+            tokenizer, model, _ = synthetic_model(genre, "numpy", work_dir)
+        args.prompt = "".join(tokenizer.get_vocabulary()[10:12])
+        generator = PoemGenerator(genre, tokenizer, model, constrained=True)
+    else:
+        config_dict = next(cfg for cfg in read_config_dicts(args.config) if cfg['genre'] == args.genre)
+        config = PoemConfig.from_config(config_dict)
+        generator = PoemGenerator(config.genre, config.tokenizer, config.generation_model, constrained=True)
+
+    # Warm up the decoder before timing
+    generator.beam_search(args.prompt, max(args.widths))
+
+    print(f"{'width':>6} {'p50 (ms)':>10} {'p90 (ms)':>10} {'ms/beam':>10}")
+    for width in args.widths:
+        latencies = np.array(time_beam_search(generator, args.prompt, width, args.repeats)) * 1000
+        p50, p90 = np.percentile(latencies, [50, 90])
+        print(f"{width:>6} {p50:>10.1f} {p90:>10.1f} {p50 / width:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
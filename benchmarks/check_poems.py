@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Poem validation: vectorized check_poems against the per-poem `Series.apply` version
+
+Builds a synthetic multi-dynasty corpus (valid poems, plus wrong lengths, misplaced
+punctuation, other genres and missing values), checks that both implementations return
+the same mask and report, and times them.
+
+Run:
+  python -m benchmarks.check_poems
+  python -m benchmarks.check_poems -g QILV --poems 500000 --repeats 5
+"""
+
+import argparse
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import cjk_characters
+from poem.genre import Genre, PUNCTUATIONS
+from train.read_dataset import check_poem, check_poems, report_check_results
+
+DYNASTIES = ["先秦", "汉", "魏晋", "南北朝", "隋", "唐", "宋", "元", "明", "清"]
+
+
+def check_poems_apply(poem_texts: pd.Series, genre: Genre) -> pd.Series:
+    """
+    The previous implementation: `check_poem` once per poem.
+    """
+    check_for_current_genre = partial(check_poem, rows=genre.rows, cols=genre.cols)
+    return poem_texts.str[:genre.length].apply(check_for_current_genre)
+
+
+def synthetic_corpus(genre: Genre, count: int, seed: int = 0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    chars = np.array(cjk_characters(6000))
+    punctuations = np.array(list(PUNCTUATIONS))
+
+    body = rng.choice(chars, (count, genre.length))
+    positions = genre.punctuation_positions
+    body[:, positions] = rng.choice(punctuations, (count, len(positions)))
+    poems = ["".join(row) for row in body]
+
+    # Corrupt a share of the poems in the ways the real data is dirty
+    for i in np.flatnonzero(rng.random(count) < 0.3):
+        kind = rng.integers(4)
+        if kind == 0:
+            poems[i] = poems[i][:-rng.integers(1, genre.cols)]
+        elif kind == 1:
+            poems[i] = poems[i] + "".join(rng.choice(chars, genre.cols + 1))
+        elif kind == 2:
+            j = rng.choice(positions)
+            poems[i] = poems[i][:j] + rng.choice(chars) + poems[i][j + 1:]
+        else:
+            poems[i] = np.nan
+
+    index = pd.MultiIndex.from_arrays([rng.choice(DYNASTIES, count), np.arange(count)])
+    return pd.Series(poems, index=index, dtype=object)
+
+
+def time_check(check, poem_texts: pd.Series, genre: Genre, repeats: int) -> tuple[pd.Series, float]:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        mask = check(poem_texts, genre)
+        best = min(best, time.perf_counter() - start)
+    return mask, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="诗歌校验（check_poems）的向量化实现与逐条实现对比")
+    parser.add_argument("-g", "--genre", default="WUJUE", choices=[g.name for g in Genre], help="体裁（默认 WUJUE）")
+    parser.add_argument("--poems", type=int, default=300_000, help="合成语料的诗歌数量（默认 300000）")
+    parser.add_argument("--repeats", type=int, default=3, help="重复次数，取最快的一次（默认 3）")
+    args = parser.parse_args()
+
+    genre = Genre[args.genre]
+    poem_texts = synthetic_corpus(genre, args.poems)
+
+    reference, apply_seconds = time_check(check_poems_apply, poem_texts, genre, args.repeats)
+    mask, vectorized_seconds = time_check(check_poems, poem_texts, genre, args.repeats)
+
+    if not mask.equals(reference.astype(bool)):
+        raise AssertionError("向量化实现的结果与逐条实现不一致")
+    print(f"report: {report_check_results(mask)} (same for both implementations)")
+    print(f"apply      {apply_seconds * 1000:8.1f} ms")
+    print(f"vectorized {vectorized_seconds * 1000:8.1f} ms ({apply_seconds / vectorized_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Corpus deduplication: exact and MinHash/LSH near-duplicate removal
+
+Builds a synthetic checked corpus (see benchmarks.check_poems) and adds copies of some of its
+poems under other dynasties: exact copies, and copies with 1, 2, 4 ... characters replaced.
+For each method it reports:
+- time and peak traced memory of `deduplicate`
+- how many copies of each kind were removed (recall), and how many original poems were
+  removed although they have no copy (false positives)
+
+Run:
+  python -m benchmarks.dedup
+  python -m benchmarks.dedup -g QILV --poems 300000 --copies 5000 --threshold 0.7
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.check_poems import DYNASTIES, synthetic_corpus
+from poem.genre import Genre
+from train.read_dataset import check_poems, deduplicate
+
+_REPLACEMENT_CHAR = "丁"
+
+
+def with_copies(poems: pd.Series, genre: Genre, copies: int, edits: list[int], seed: int = 0) -> pd.Series:
+    """
+    `poems` followed by `copies` copies for each number of replaced characters in `edits`
+    (0 is an exact copy); the copies are labelled by the second index level "copy-<edits>-<k>".
+    """
+    rng = np.random.default_rng(seed)
+    characters = [i for i in range(genre.length) if i not in set(genre.punctuation_positions)]
+    parts = [poems]
+    for num_edits in edits:
+        sources = poems.iloc[rng.choice(len(poems), copies, replace=False)].to_numpy()
+        copied = []
+        for text in sources:
+            chars = list(text)
+            for i in rng.choice(characters, num_edits, replace=False):
+                chars[i] = _REPLACEMENT_CHAR
+            copied.append("".join(chars))
+        index = pd.MultiIndex.from_arrays([rng.choice(DYNASTIES, copies),
+                                           [f"copy-{num_edits}-{k}" for k in range(copies)]])
+        parts.append(pd.Series(copied, index=index, dtype=object))
+    return pd.concat(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语料去重：完全重复与 MinHash/LSH 近似重复的耗时、内存与召回率")
+    parser.add_argument("-g", "--genre", default="WUJUE", choices=[g.name for g in Genre], help="体裁（默认 WUJUE）")
+    parser.add_argument("--poems", type=int, default=300_000, help="合成语料的诗歌数量（校验前，默认 300000）")
+    parser.add_argument("--copies", type=int, default=2000, help="每种改动字数的重复份数（默认 2000）")
+    parser.add_argument("--edits", type=int, nargs="+", default=[0, 1, 2, 4], help="重复份中替换的字数（0 为完全相同）")
+    parser.add_argument("--threshold", type=float, default=0.8, help="近似重复的 Jaccard 阈值（默认 0.8）")
+    args = parser.parse_args()
+
+    genre = Genre[args.genre]
+    poems = synthetic_corpus(genre, args.poems)
+    poems = poems[check_poems(poems, genre)].str[:genre.length]
+    corpus = with_copies(poems, genre, args.copies, args.edits)
+    labels = corpus.index.get_level_values(1).astype(str)
+    print(f"{genre.name}: {len(poems)} checked poems + {len(corpus) - len(poems)} copies")
+
+    results = {}
+    for method in ("exact", "near"):
+        tracemalloc.start()
+        start = time.perf_counter()
+        kept = deduplicate(corpus, genre, method, args.threshold)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        removed = ~corpus.index.isin(kept.index)
+        results[method] = (seconds, peak, removed)
+
+    print(f"{'method':<6} {'time (s)':>9} {'peak (MB)':>10} "
+          + " ".join(f"{f'{n} edits':>9}" for n in args.edits) + f" {'false pos.':>10}")
+    for method, (seconds, peak, removed) in results.items():
+        recall = [removed[labels.str.startswith(f"copy-{n}-")].mean() for n in args.edits]
+        false_positives = int(removed[~labels.str.startswith("copy-")].sum())
+        print(f"{method:<6} {seconds:>9.2f} {peak / 2 ** 20:>10.1f} "
+              + " ".join(f"{r:>9.1%}" for r in recall) + f" {false_positives:>10}")
+
+
+if __name__ == "__main__":
+    main()
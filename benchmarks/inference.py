@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Offline inference benchmark with synthetic models
+
+Runs without data or network: every genre gets a random-weight model of realistic
+vocabulary size (see benchmarks/synthetic.py). For each Genre it reports:
+- single requests: per-poem latency percentiles and tokens/sec
+- batched requests: PoemGenerator.generate_batch at several batch sizes
+- concurrent callers: threads sharing one BatchScheduler
+- import/startup time and peak RSS, measured in a fresh interpreter that serves only that genre
+
+The benchmark process's own peak RSS covers all genres together and is reported once, as
+`cumulative_peak_rss_mb`.
+
+Results are written as JSON (with the git commit) so runs can be compared across commits.
+
+Run:
+  python -m benchmarks.inference --output bench/results.json
+  python -m benchmarks.inference -g WUJUE --backend keras --requests 20
+  python -m benchmarks.inference --compare bench/before.json --output bench/after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.startup import run_startup_script
+from benchmarks.synthetic import synthetic_model, synthetic_prompts
+from poem.batching import BatchScheduler
+from poem.generator import PoemGenerator
+from poem.genre import Genre
+
+PERCENTILES = (50, 90, 99)
+
+# Serving-path startup, measured in a fresh interpreter (see benchmarks.startup): import, load the saved model, first poem
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from poem.config import PoemConfig
+from poem.generator import PoemGenerator
+imported = time.perf_counter()
+config = PoemConfig.from_config(json.loads(sys.argv[1]))
+loaded = time.perf_counter()
+PoemGenerator(config.genre, config.tokenizer, config.generation_model).generate("一", 1.0)
+ready = time.perf_counter()
+result = {"import_seconds": imported - start, "load_seconds": loaded - imported, "first_poem_seconds": ready - start}
+"""
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux. It is the high-water mark of the whole process, so it covers
+    # every genre benchmarked so far; per-genre memory comes from the fresh-interpreter startup
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(latencies: list[float], tokens: int, elapsed: float) -> dict:
+    values = np.array(latencies) * 1000
+    summary = {f"p{p}_ms": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary.update({
+        "mean_ms": float(values.mean()),
+        "count": len(latencies),
+        "tokens_per_second": tokens / elapsed,
+    })
+    return summary
+
+
+def bench_single(generator: PoemGenerator, prompts: list[str], temperature: float) -> dict:
+    latencies, tokens = [], 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        t = time.perf_counter()
+        poem = generator.generate(prompt, temperature)
+        latencies.append(time.perf_counter() - t)
+        tokens += len(poem) - len(prompt)
+    return summarize(latencies, tokens, time.perf_counter() - start)
+
+
+def bench_batched(generator: PoemGenerator, prompts: list[str], temperature: float, batch_size: int) -> dict:
+    latencies, tokens = [], 0
+    start = time.perf_counter()
+    for i in range(0, len(prompts), batch_size):
+        batch = prompts[i:i + batch_size]
+        t = time.perf_counter()
+        poems = generator.generate_batch(batch, [temperature] * len(batch))
+        latencies.append(time.perf_counter() - t)
+        tokens += sum(len(poem) - len(prompt) for poem, prompt in zip(poems, batch))
+    result = summarize(latencies, tokens, time.perf_counter() - start)
+    result["batch_size"] = batch_size
+    return result
+
+
+def bench_concurrent(generator: PoemGenerator, prompts: list[str], temperature: float, callers: int,
+                     max_batch_size: int, max_wait_ms: float) -> dict:
+    scheduler = BatchScheduler(generator, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def call(prompt: str):
+        t = time.perf_counter()
+        poem = scheduler.generate(prompt, temperature)
+        return time.perf_counter() - t, len(poem) - len(prompt)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(callers) as executor:
+            results = list(executor.map(call, prompts))
+        elapsed = time.perf_counter() - start
+    finally:
+        scheduler.close()
+    result = summarize([latency for latency, _ in results], sum(tokens for _, tokens in results), elapsed)
+    result.update({"callers": callers, "max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms})
+    return result
+
+
+def measure_startup(config: dict) -> dict:
+    return run_startup_script(_STARTUP_SCRIPT, json.dumps(config))
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_genre(genre: Genre, args, work_dir: str) -> dict:
+    tokenizer, model, config = synthetic_model(genre, args.backend, work_dir)
+    generator = PoemGenerator(genre, tokenizer, model, constrained=args.constrained)
+    prompts = synthetic_prompts(tokenizer, args.requests)
+
+    # Warm up before timing
+    generator.generate_batch(prompts[:max(args.batch_sizes)], [args.temperature] * max(args.batch_sizes))
+
+    result = {
+        "single": bench_single(generator, prompts, args.temperature),
+        "batched": [bench_batched(generator, prompts, args.temperature, size) for size in args.batch_sizes],
+        "concurrent": [bench_concurrent(generator, prompts, args.temperature, callers, args.max_batch_size,
+                                        args.max_wait_ms) for callers in args.concurrency],
+    }
+    if not args.skip_startup:
+        result["startup"] = measure_startup(config)
+    return result
+
+
+def print_report(results: dict, baseline: dict = None):
+    for genre_name, result in results["genres"].items():
+        before = (baseline or {}).get("genres", {}).get(genre_name)
+
+        def ratio(section: dict, previous: dict) -> str:
+            if not previous:
+                return ""
+            return f" ({section['tokens_per_second'] / previous['tokens_per_second']:.2f}x)"
+
+        single = result["single"]
+        print(f"== {genre_name} ({results['backend']}) ==")
+        print(f"  single      p50={single['p50_ms']:.1f}ms p90={single['p90_ms']:.1f}ms p99={single['p99_ms']:.1f}ms "
+              f"{single['tokens_per_second']:.0f} tok/s{ratio(single, before and before['single'])}")
+        for k, batched in enumerate(result["batched"]):
+            previous = before and k < len(before["batched"]) and before["batched"][k]
+            print(f"  batch={batched['batch_size']:<4} p50={batched['p50_ms']:.1f}ms "
+                  f"{batched['tokens_per_second']:.0f} tok/s{ratio(batched, previous)}")
+        for k, concurrent in enumerate(result["concurrent"]):
+            previous = before and k < len(before["concurrent"]) and before["concurrent"][k]
+            print(f"  callers={concurrent['callers']:<3} p50={concurrent['p50_ms']:.1f}ms "
+                  f"p99={concurrent['p99_ms']:.1f}ms {concurrent['tokens_per_second']:.0f} tok/s"
+                  f"{ratio(concurrent, previous)}")
+        if "startup" in result:
+            startup = result["startup"]
+            print(f"  startup: import {startup['import_seconds']:.2f}s, load {startup['load_seconds']:.2f}s, "
+                  f"first poem {startup['first_poem_seconds']:.2f}s, peak RSS {startup['peak_rss_mb']:.0f} MB")
+    print(f"peak RSS {results['cumulative_peak_rss_mb']:.0f} MB (whole benchmark process, all genres, "
+          f"includes building the synthetic models)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于合成模型的离线推理基准测试")
+    parser.add_argument("-g", "--genre", action="append", choices=[g.name for g in Genre],
+                        help="只测试指定体裁，可重复；默认测试全部")
+    parser.add_argument("--backend", choices=["numpy", "keras"], default="numpy", help="推理后端（默认 numpy）")
+    parser.add_argument("--requests", type=int, default=50, help="每种场景的请求数（默认 50）")
+    parser.add_argument("--temperature", type=float, default=1.0, help="采样温度（默认 1.0）")
+    parser.add_argument("--constrained", action="store_true", help="使用结构约束解码")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32], help="批量场景的 batch 大小")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="并发场景的调用方数量")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="并发场景中 BatchScheduler 的最大 batch")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="并发场景中 BatchScheduler 的收集窗口")
+    parser.add_argument("--skip-startup", action="store_true", help="跳过启动时间测量")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("-o", "--output", help="结果 JSON 的保存路径")
+    args = parser.parse_args()
+
+    genres = [Genre[name] for name in args.genre] if args.genre else list(Genre)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "backend": args.backend,
+        "args": vars(args),
+        "genres": {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for genre in genres:
+            results["genres"][genre.name] = bench_genre(genre, args, work_dir)
+    results["cumulative_peak_rss_mb"] = peak_rss_mb()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Serving memory and latency: one multi-genre model against four per-genre models
+
+Both setups are built from random weights (see benchmarks/synthetic.py) and saved as
+poem_config.json style entries. Each is then served in a fresh interpreter that loads
+all four genres, the way app.py does, and reports:
+- load time and resident memory once every genre is loaded (VmRSS / VmHWM), and the part of it
+  added by loading the models (RSS above the interpreter and libraries)
+- per-genre latency percentiles of PoemGenerator.generate
+
+Run:
+  python -m benchmarks.multi_genre
+  python -m benchmarks.multi_genre --backend keras --requests 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import CJK_CODE_POINTS, synthetic_model, synthetic_multi_genre_model
+from poem.genre import Genre
+
+_SERVE_SCRIPT = """
+import json, sys, time
+import numpy as np
+from poem.config import PoemConfig
+from poem.generator import PoemGenerator
+
+def memory_mb():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {key: int(fields[key].split()[0]) / 1024 for key in ("VmRSS", "VmHWM")}
+
+configs, prompts = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+baseline_mb = memory_mb()["VmRSS"]
+start = time.perf_counter()
+generators = []
+for config in configs:
+    config = PoemConfig.from_config(config)
+    generators.append(PoemGenerator(config.genre, config.tokenizer, config.generation_model, constrained=True))
+loaded = time.perf_counter()
+for generator in generators:
+    generator.generate(prompts[0], 1.0)
+result = {"load_seconds": loaded - start, "first_poems_seconds": time.perf_counter() - loaded, **memory_mb(),
+          "baseline_mb": baseline_mb, "latency": {}}
+for generator in generators:
+    latencies = []
+    for prompt in prompts:
+        t = time.perf_counter()
+        generator.generate(prompt, 1.0)
+        latencies.append((time.perf_counter() - t) * 1000)
+    result["latency"][generator.genre.name] = {f"p{p}_ms": float(np.percentile(latencies, p)) for p in (50, 90)}
+print(json.dumps(result))
+"""
+
+
+def serve(configs: list[dict], prompts: list[str]) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", _SERVE_SCRIPT, json.dumps(configs), json.dumps(prompts)],
+                            check=True, capture_output=True, text=True, cwd=root)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多体裁单模型与分体裁模型的内存与延迟对比")
+    parser.add_argument("--backend", choices=["numpy", "keras"], default="numpy", help="推理后端（默认 numpy）")
+    parser.add_argument("--requests", type=int, default=50, help="每个体裁的请求数（默认 50）")
+    args = parser.parse_args()
+
+    # Prompts from the CJK block shared by every synthetic vocabulary
+    prompts = [chr(CJK_CODE_POINTS[7 * i]) + chr(CJK_CODE_POINTS[11 * i + 1]) for i in range(args.requests)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        per_genre_configs = [synthetic_model(genre, args.backend, work_dir)[2] for genre in Genre]
+        multi_genre_configs = synthetic_multi_genre_model(args.backend, work_dir)[2]
+        results = {
+            "per-genre": serve(per_genre_configs, prompts),
+            "multi-genre": serve(multi_genre_configs, prompts),
+        }
+
+    print(f"{'setup':<12} {'load (s)':>9} {'RSS (MB)':>9} {'models (MB)':>12} {'peak (MB)':>10}  "
+          + " ".join(f"{genre.name + ' p50':>12}" for genre in Genre))
+    for setup, result in results.items():
+        result["models_mb"] = result["VmRSS"] - result["baseline_mb"]
+        latencies = " ".join(f"{result['latency'][genre.name]['p50_ms']:>10.1f}ms" for genre in Genre)
+        print(f"{setup:<12} {result['load_seconds']:>9.2f} {result['VmRSS']:>9.0f} {result['models_mb']:>12.0f} "
+              f"{result['VmHWM']:>10.0f}  {latencies}")
+    per_genre, multi_genre = results["per-genre"], results["multi-genre"]
+    print(f"per-genre / multi-genre: RSS {per_genre['VmRSS'] / multi_genre['VmRSS']:.2f}x, "
+          f"models {per_genre['models_mb'] / multi_genre['models_mb']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
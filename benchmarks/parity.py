@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Backend parity check with synthetic models
+
+Runs without data or network (the checked-in `.keras` files are Git LFS pointers): for each
+genre it builds a random-weight Keras model (see benchmarks/synthetic.py), exports it to
+NumpyDecoder weights and checks that
+- NumpyDecoder gives the same next-token distributions as the Keras model (export_weights.check_parity)
+- greedy decoding (temperature 0) gives the same poems with full re-decoding of the Keras model,
+  incremental decoding of the Keras model and the NumpyDecoder
+
+Exits with status 1 on any mismatch.
+
+Run:
+  python -m benchmarks.parity
+  python -m benchmarks.parity -g WUJUE --prompts 8
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.synthetic import synthetic_model, synthetic_prompts
+from export_weights import PARITY_TOLERANCE, check_parity
+from poem.generator import PoemGenerator
+from poem.genre import Genre
+from poem.numpy_decoder import NumpyDecoder, export_weights
+
+
+def check_genre(genre: Genre, work_dir: str, num_prompts: int, lstm_units: int) -> bool:
+    tokenizer, model, config = synthetic_model(genre, "keras", work_dir, lstm_units=lstm_units)
+    weights_path = os.path.join(work_dir, f"{genre.name}_synthetic.npz")
+    export_weights(model, weights_path)
+    decoder = NumpyDecoder.load(weights_path)
+
+    max_diff = check_parity(model, decoder, genre)
+    distributions_ok = max_diff < PARITY_TOLERANCE
+    print(f"[INFO] {genre.name}: NumpyDecoder vs Keras {'OK' if distributions_ok else 'MISMATCH'}, "
+          f"max |Δp| = {max_diff:.2e}")
+
+    prompts = synthetic_prompts(tokenizer, num_prompts)
+    temperatures = [0.0] * num_prompts
+    generators = {
+        "keras full": PoemGenerator(genre, tokenizer, model, incremental=False),
+        "keras incremental": PoemGenerator(genre, tokenizer, model),
+        "numpy": PoemGenerator(genre, tokenizer, decoder),
+    }
+    poems = {name: generator.generate_batch(prompts, temperatures) for name, generator in generators.items()}
+    expected = poems.pop("keras full")
+    greedy_ok = True
+    for name, generated in poems.items():
+        same = sum(a == b for a, b in zip(generated, expected))
+        greedy_ok &= same == num_prompts
+        print(f"[INFO] {genre.name}: greedy {name:<17} {same}/{num_prompts} poems match keras full")
+    return distributions_ok and greedy_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成模型上的后端一致性检查：Keras 与 NumPy，完整解码与增量解码")
+    parser.add_argument("-g", "--genre", action="append", choices=[g.name for g in Genre],
+                        help="只检查指定体裁，可重复；默认全部")
+    parser.add_argument("--prompts", type=int, default=4, help="每个体裁贪心解码的提示词数量（默认 4）")
+    parser.add_argument("--lstm-units", type=int, default=128, help="合成模型的 LSTM 单元数（默认 128）")
+    args = parser.parse_args()
+
+    genres = [Genre[name] for name in args.genre] if args.genre else list(Genre)
+    with tempfile.TemporaryDirectory() as work_dir:
+        failed = [genre.name for genre in genres if not check_genre(genre, work_dir, args.prompts, args.lstm_units)]
+    if failed:
+        print(f"[WARN] parity mismatch: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Int8 weight quantization: memory, speed and accuracy against the float32 NumpyDecoder
+
+For each genre (from the `weights_path` entries of poem_config.json, or synthetic models
+with `--synthetic`) it reports:
+- weight memory of both decoders
+- tokens/sec of PoemGenerator.generate_batch at several batch sizes
+- how much the next-token distributions diverge on held-out prompts: KL(float || int8)
+  and top-1 agreement, at every position of the poems the float model writes greedily
+
+Note that random synthetic weights say little about accuracy on real models.
+
+Run:
+  python -m benchmarks.quantization
+  python -m benchmarks.quantization --synthetic -g WUJUE --prompts 64
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_model, synthetic_prompts
+from poem.config import load_tokenizer, read_config_dicts
+from poem.generator import PoemGenerator
+from poem.genre import Genre
+from poem.numpy_decoder import NumpyDecoder
+from poem.quantization import QuantizedDecoder
+from poem.tokenizer import Tokenizer
+
+
+def tokens_per_second(generator: PoemGenerator, prompts: list[str], batch_size: int) -> float:
+    # Warm up before timing
+    generator.generate_batch(prompts[:batch_size], [1.0] * batch_size)
+    tokens = 0
+    start = time.perf_counter()
+    for i in range(0, len(prompts), batch_size):
+        batch = prompts[i:i + batch_size]
+        poems = generator.generate_batch(batch, [1.0] * len(batch), np.random.default_rng(i))
+        tokens += sum(len(poem) - len(prompt) for poem, prompt in zip(poems, batch))
+    return tokens / (time.perf_counter() - start)
+
+
+def divergence(decoder: NumpyDecoder, quantized: QuantizedDecoder, generator: PoemGenerator,
+               prompts: list[str]) -> dict:
+    """
+    Teacher-force both decoders along the greedy float poems and compare every next-token distribution.
+    """
+    poems = generator.generate_batch(prompts, [0.0] * len(prompts))
+    token_ids = np.array([generator.encode_prompt(poem) for poem in poems])
+    float_state = decoder.initial_state(len(token_ids))
+    int8_state = quantized.initial_state(len(token_ids))
+    kl, agreement = [], []
+    for t in range(token_ids.shape[1] - 1):
+        float_state = decoder.step(token_ids[:, t:t + 1], float_state)
+        int8_state = quantized.step(token_ids[:, t:t + 1], int8_state)
+        p = np.asarray(decoder.project(float_state), dtype=np.float64)
+        q = np.asarray(quantized.project(int8_state), dtype=np.float64)
+        p, q = p / p.sum(axis=1, keepdims=True), q / q.sum(axis=1, keepdims=True)
+        kl.append(np.sum(p * (np.log(np.maximum(p, 1e-30)) - np.log(np.maximum(q, 1e-30))), axis=1))
+        agreement.append(p.argmax(axis=1) == q.argmax(axis=1))
+    kl = np.concatenate(kl)
+    return {"kl_mean": float(kl.mean()), "kl_p99": float(np.percentile(kl, 99)),
+            "top1_agreement": float(np.concatenate(agreement).mean())}
+
+
+def load_genre(genre: Genre, args, work_dir: str) -> tuple[Tokenizer, str]:
+    if args.synthetic:
+        tokenizer, _, config = synthetic_model(genre, "numpy", work_dir)
+        return tokenizer, config["weights_path"]
+    config = next((cfg for cfg in read_config_dicts(args.config) if cfg['genre'] == genre.name), None)
+    if config is None or not config.get('weights_path'):
+        raise SystemExit(f"{genre.name} 未配置 weights_path，请先运行 export_weights.py 或使用 --synthetic")
+    return load_tokenizer(config['vocabulary_path']), config['weights_path']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 量化权重与 float32 权重的内存、速度与分布差异对比")
+    parser.add_argument("-c", "--config", default="poem_config.json", help="配置文件（默认 poem_config.json）")
+    parser.add_argument("-g", "--genre", action="append", choices=[g.name for g in Genre],
+                        help="只测试指定体裁，可重复；默认测试全部")
+    parser.add_argument("--synthetic", action="store_true", help="使用随机权重的合成模型")
+    parser.add_argument("--prompts", type=int, default=64, help="测速与计算分布差异的提示词数量（默认 64）")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32], help="测速的 batch 大小")
+    args = parser.parse_args()
+
+    genres = [Genre[name] for name in args.genre] if args.genre else list(Genre)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for genre in genres:
+            tokenizer, weights_path = load_genre(genre, args, work_dir)
+            decoder = NumpyDecoder.load(weights_path)
+            quantized = QuantizedDecoder.load(weights_path)
+            # Held out: a different seed from the prompts used for timing
+            prompts = synthetic_prompts(tokenizer, args.prompts, seed=0)
+            held_out = synthetic_prompts(tokenizer, args.prompts, seed=1)
+
+            float_generator = PoemGenerator(genre, tokenizer, decoder, constrained=True)
+            int8_generator = PoemGenerator(genre, tokenizer, quantized, constrained=True)
+
+            print(f"== {genre.name} ==")
+            print(f"  weights  float32 {decoder.nbytes / 2 ** 20:.1f} MB, int8 {quantized.nbytes / 2 ** 20:.1f} MB "
+                  f"({decoder.nbytes / quantized.nbytes:.2f}x smaller)")
+            for batch_size in args.batch_sizes:
+                float_speed = tokens_per_second(float_generator, prompts, batch_size)
+                int8_speed = tokens_per_second(int8_generator, prompts, batch_size)
+                print(f"  batch={batch_size:<3} float32 {float_speed:.0f} tok/s, int8 {int8_speed:.0f} tok/s "
+                      f"({int8_speed / float_speed:.2f}x)")
+            stats = divergence(decoder, quantized, float_generator, held_out)
+            print(f"  KL(float || int8) mean {stats['kl_mean']:.2e}, p99 {stats['kl_p99']:.2e}, "
+                  f"top-1 agreement {stats['top1_agreement'] * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Training objective: sampled softmax against the full softmax
+
+Both objectives train the same `build_model` decoder (same initial weights and batches) on a
+synthetic corpus with a Zipfian character distribution and a learnable next-character rule.
+For each it reports:
+- seconds per epoch (the first epoch, which includes tracing, is reported separately)
+- full-softmax perplexity of the trained decoder on held-out rows, i.e. as served by PoemGenerator
+
+Run:
+  python -m benchmarks.sampled_softmax
+  python -m benchmarks.sampled_softmax -g WULV --epochs 3 --num-sampled 256 512 1024
+"""
+
+import argparse
+import time
+from dataclasses import replace
+
+import keras
+import numpy as np
+
+from benchmarks.synthetic import SYNTHETIC_VOCABULARY_SIZES
+from poem.genre import Genre
+from train.config import Config
+from train.generation_model import (SequenceBatches, build_model, compile_for_training, evaluate_perplexity)
+
+# Reserved ids below this: padding and [UNK]
+_FIRST_TOKEN_ID = 2
+
+
+def synthetic_corpus(vocabulary_size: int, rows: int, length: int, seed: int = 0) -> np.ndarray:
+    """
+    Token rows where each next token follows a fixed successor of the previous one half of the
+    time, and is drawn from a Zipf distribution over the vocabulary otherwise.
+    """
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocabulary_size - _FIRST_TOKEN_ID + 1)
+    zipf = 1.0 / ranks
+    zipf /= zipf.sum()
+    successor = _FIRST_TOKEN_ID + rng.permutation(vocabulary_size - _FIRST_TOKEN_ID)
+
+    token_ids = np.empty((rows, length), dtype=np.int32)
+    token_ids[:, 0] = _FIRST_TOKEN_ID + rng.choice(len(zipf), rows, p=zipf)
+    for t in range(1, length):
+        follow = rng.random(rows) < 0.5
+        drawn = _FIRST_TOKEN_ID + rng.choice(len(zipf), rows, p=zipf)
+        token_ids[:, t] = np.where(follow, successor[token_ids[:, t - 1] - _FIRST_TOKEN_ID], drawn)
+    return token_ids
+
+
+class EpochTimes(keras.callbacks.Callback):
+    def on_train_begin(self, logs=None):
+        self.seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.seconds.append(time.perf_counter() - self._start)
+
+
+def train(config: Config, vocabulary_size: int, train_ids: np.ndarray, held_out_ids: np.ndarray) -> dict:
+    keras.utils.set_random_seed(0)
+    model = build_model(config, vocabulary_size)
+    trainer = compile_for_training(model, config)
+    times = EpochTimes()
+    batches = SequenceBatches(train_ids[:, :-1], train_ids[:, 1:], config.batch_size, seed=0)
+    trainer.fit(batches, epochs=config.epochs, callbacks=[times], verbose=0)
+    rows = np.arange(len(held_out_ids))
+    return {
+        "first_epoch_seconds": times.seconds[0],
+        "epoch_seconds": float(np.mean(times.seconds[1:] or times.seconds)),
+        "perplexity": evaluate_perplexity(model, held_out_ids[:, :-1], held_out_ids[:, 1:], rows, config.batch_size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sampled softmax 与完整 softmax 训练的耗时与困惑度对比")
+    parser.add_argument("-g", "--genre", default="QILV", choices=[g.name for g in Genre], help="体裁（默认 QILV）")
+    parser.add_argument("--rows", type=int, default=8192, help="训练用的合成诗数（默认 8192）")
+    parser.add_argument("--held-out", type=int, default=1024, help="计算困惑度的留出诗数（默认 1024）")
+    parser.add_argument("--epochs", type=int, default=3, help="训练轮数（默认 3）")
+    parser.add_argument("--num-sampled", type=int, nargs="+", default=[512], help="sampled softmax 的负类数")
+    parser.add_argument("-u", "--lstm-units", type=int, default=512, help="LSTM 单元数（默认 512）")
+    parser.add_argument("-b", "--batch-size", type=int, default=256, help="Batch size（默认 256）")
+    args = parser.parse_args()
+
+    genre = Genre[args.genre]
+    vocabulary_size = SYNTHETIC_VOCABULARY_SIZES[genre]
+    corpus = synthetic_corpus(vocabulary_size, args.rows + args.held_out, genre.length)
+    train_ids, held_out_ids = corpus[:args.rows], corpus[args.rows:]
+    config = Config(genre=genre, epochs=args.epochs, lstm_units=args.lstm_units, batch_size=args.batch_size)
+
+    results = {"full": train(config, vocabulary_size, train_ids, held_out_ids)}
+    for num_sampled in args.num_sampled:
+        results[f"sampled/{num_sampled}"] = train(replace(config, softmax="sampled", num_sampled=num_sampled),
+                                                  vocabulary_size, train_ids, held_out_ids)
+
+    full = results["full"]
+    print(f"{genre.name}: vocabulary {vocabulary_size}, {args.rows} rows x {genre.length} tokens, {args.epochs} epochs")
+    print(f"{'objective':<14} {'1st epoch (s)':>14} {'epoch (s)':>10} {'speedup':>8} {'perplexity':>11} {'vs full':>8}")
+    for name, result in results.items():
+        print(f"{name:<14} {result['first_epoch_seconds']:>14.1f} {result['epoch_seconds']:>10.1f} "
+              f"{full['epoch_seconds'] / result['epoch_seconds']:>7.2f}x {result['perplexity']:>11.1f} "
+              f"{result['perplexity'] / full['perplexity']:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Startup time and peak memory, measured in a fresh interpreter
+
+Used by benchmarks.inference and export_weights.py --compare: a script run in a new process
+includes the imports in its timings, and its peak RSS is not mixed with the caller's.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Appended to every script. Peak RSS is read from VmHWM: ru_maxrss would be inherited from
+# the calling process across fork/exec
+_REPORT_SCRIPT = """
+with open("/proc/self/status") as f:
+    result["peak_rss_mb"] = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+print(json.dumps(result))
+"""
+
+
+def run_startup_script(script: str, *args: str) -> dict:
+    """
+    Run `script` with `args` in a fresh interpreter from the repository root and return its
+    `result` dict, which the script fills (`json` and `sys` are imported), plus "peak_rss_mb".
+    """
+    result = subprocess.run([sys.executable, "-c", "import json, sys\n" + script + _REPORT_SCRIPT, *args],
+                            check=True, capture_output=True, text=True, cwd=REPOSITORY_ROOT)
+    return json.loads(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,121 @@
+"""
+Synthetic models and vocabularies for benchmarks
+
+The checked-in `.keras` files are Git LFS pointers, so benchmarks build models with
+`train/generation_model.build_model` and random weights instead. Vocabulary sizes
+match the trained per-genre vocabularies in `models/`.
+"""
+
+import os
+
+import numpy as np
+
+from poem.genre import Genre, PUNCTUATIONS
+from poem.numpy_decoder import NumpyDecoder, export_weights
+from poem.tokenizer import OOV_TOKEN, PADDING_TOKEN, Tokenizer
+
+# Sizes of models/*_vocabulary.txt
+SYNTHETIC_VOCABULARY_SIZES = {
+    Genre.WUJUE: 6350,
+    Genre.QIJUE: 8818,
+    Genre.WULV: 8556,
+    Genre.QILV: 9683,
+}
+# The per-genre vocabularies mostly overlap: their union is assumed a little larger than the largest one
+SYNTHETIC_MULTI_GENRE_VOCABULARY_SIZE = 10500
+
+# CJK Unified Ideographs: the characters of the synthetic vocabularies, prompts and corpora
+CJK_CODE_POINTS = range(0x4E00, 0xA000)
+
+
+def cjk_characters(count: int) -> list[str]:
+    """
+    The first `count` characters of the CJK block.
+    """
+    return [chr(code_point) for code_point in CJK_CODE_POINTS[:count]]
+
+
+def is_cjk(token: str) -> bool:
+    return len(token) == 1 and ord(token) in CJK_CODE_POINTS
+
+
+def synthetic_tokenizer(vocabulary_size: int, genre_tokens: bool = False) -> Tokenizer:
+    """
+    Padding, [UNK], the punctuation (and the genre tokens of a multi-genre model), then
+    consecutive CJK characters up to `vocabulary_size`.
+    """
+    special = [PADDING_TOKEN, OOV_TOKEN] + list(PUNCTUATIONS)
+    if genre_tokens:
+        special += [genre.token for genre in Genre]
+    chars = cjk_characters(vocabulary_size - len(special))
+    return Tokenizer(special + chars)
+
+
+def synthetic_prompts(tokenizer: Tokenizer, count: int, length: int = 2, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    # CJK characters only: no padding, [UNK], punctuation or genre tokens
+    chars = [token for token in tokenizer.get_vocabulary() if is_cjk(token)]
+    return ["".join(rng.choice(chars, length)) for _ in range(count)]
+
+
+def synthetic_keras_model(genre: Genre, vocabulary_size: int, seed: int = 0, **config_overrides):
+    import keras
+    from train.config import Config
+    from train.generation_model import build_model
+
+    keras.utils.set_random_seed(seed)
+    return build_model(Config(genre=genre, **config_overrides), vocabulary_size)
+
+
+def synthetic_model(genre: Genre, backend: str, work_dir: str, vocabulary_size: int = None, seed: int = 0,
+                    **config_overrides):
+    """
+    Build a random-weight model for `genre`, save it to `work_dir` and return
+    (tokenizer, generation_model, config), where `config` is a poem_config.json style entry.
+
+    For the "numpy" backend the weights are exported and loaded as a NumpyDecoder.
+    """
+    if backend not in ("keras", "numpy"):
+        raise ValueError(f"未知的后端：{backend}")
+    vocabulary_size = vocabulary_size or SYNTHETIC_VOCABULARY_SIZES[genre]
+    tokenizer = synthetic_tokenizer(vocabulary_size)
+    model = synthetic_keras_model(genre, vocabulary_size, seed, **config_overrides)
+
+    config = {
+        "genre": genre.name,
+        "vocabulary_path": os.path.join(work_dir, f"{genre.name}_synthetic_vocabulary.txt"),
+        "model_path": os.path.join(work_dir, f"{genre.name}_synthetic.keras"),
+    }
+    tokenizer.save(config["vocabulary_path"])
+    if backend == "keras":
+        model.save(config["model_path"])
+        return tokenizer, model, config
+
+    config["weights_path"] = os.path.join(work_dir, f"{genre.name}_synthetic.npz")
+    export_weights(model, config["weights_path"])
+    return tokenizer, NumpyDecoder.load(config["weights_path"]), config
+
+
+def synthetic_multi_genre_model(backend: str, work_dir: str, vocabulary_size: int = SYNTHETIC_MULTI_GENRE_VOCABULARY_SIZE,
+                                seed: int = 0, **config_overrides):
+    """
+    Like `synthetic_model`, for one model conditioned on the genre token with a shared vocabulary.
+    Returns (tokenizer, generation_model, configs) with one poem_config.json entry per genre.
+    """
+    if backend not in ("keras", "numpy"):
+        raise ValueError(f"未知的后端：{backend}")
+    tokenizer = synthetic_tokenizer(vocabulary_size, genre_tokens=True)
+    model = synthetic_keras_model(None, vocabulary_size, seed, **config_overrides)
+
+    shared = {
+        "vocabulary_path": os.path.join(work_dir, "MULTI_synthetic_vocabulary.txt"),
+        "model_path": os.path.join(work_dir, "MULTI_synthetic.keras"),
+    }
+    tokenizer.save(shared["vocabulary_path"])
+    if backend == "keras":
+        model.save(shared["model_path"])
+    else:
+        shared["weights_path"] = os.path.join(work_dir, "MULTI_synthetic.npz")
+        export_weights(model, shared["weights_path"])
+        model = NumpyDecoder.load(shared["weights_path"])
+    return tokenizer, model, [dict(shared, genre=genre.name) for genre in Genre]
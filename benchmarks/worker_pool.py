@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process serving: throughput against the number of worker processes
+
+A synthetic multi-genre NumPy model is saved as memory-mapped `.npy` weights and served by
+a WorkerPool (poem/worker_pool.py) with 1, 2, 4, ... workers. For each pool size it reports:
+- startup time until every worker has loaded the model
+- poems/sec with `--clients` concurrent streaming requests spread over all genres
+- memory of the workers: summed RSS, and summed PSS (shared pages split between the
+  processes mapping them), so the weights mapped by every worker count once
+
+Then, at the largest pool size, the same memory figures with the weights read from `.npz`
+(one private copy per worker) for comparison.
+
+Throughput can only scale up to the number of CPU cores; set OMP_NUM_THREADS /
+OPENBLAS_NUM_THREADS=1 to keep each worker's BLAS on one core.
+
+Run:
+  python -m benchmarks.worker_pool
+  python -m benchmarks.worker_pool --workers 1 2 4 8 --clients 32 --requests 400
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import synthetic_multi_genre_model, synthetic_prompts
+from poem.genre import Genre
+from poem.numpy_decoder import NumpyDecoder
+from poem.worker_pool import WorkerPool
+
+
+def memory_mb(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def pool_memory_mb(pool: WorkerPool) -> dict:
+    per_worker = [memory_mb(worker.process.pid) for worker in pool.workers]
+    return {key: sum(worker[key] for worker in per_worker) for key in ("Rss", "Pss")}
+
+
+def write_config(configs: list[dict], weights_path: str, work_dir: str, name: str) -> str:
+    config_path = os.path.join(work_dir, f"{name}_config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump([dict(config, weights_path=weights_path) for config in configs], f)
+    return config_path
+
+
+def run(config_path: str, num_workers: int, concurrency: int, prompts: list[str], clients: int) -> dict:
+    start = time.perf_counter()
+    pool = WorkerPool(config_path, num_workers, concurrency=concurrency)
+    startup = time.perf_counter() - start
+    genres = list(Genre)
+    try:
+        # Warm up every worker and genre before timing
+        with ThreadPoolExecutor(clients) as executor:
+            list(executor.map(lambda k: pool.generate_and_format(genres[k % len(genres)].name, prompts[0]),
+                              range(num_workers * concurrency)))
+            start = time.perf_counter()
+            list(executor.map(lambda k: pool.generate_and_format(genres[k % len(genres)].name, prompts[k]),
+                              range(len(prompts))))
+            elapsed = time.perf_counter() - start
+        return {"startup_seconds": startup, "poems_per_second": len(prompts) / elapsed, **pool_memory_mb(pool)}
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程服务的吞吐量随工作进程数的变化")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help="要测试的工作进程数")
+    parser.add_argument("--concurrency", type=int, default=8, help="每个工作进程同时处理的请求数（默认 8）")
+    parser.add_argument("--clients", type=int, default=32, help="并发请求数（默认 32）")
+    parser.add_argument("--requests", type=int, default=256, help="计时的请求数（默认 256）")
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        tokenizer, _, configs = synthetic_multi_genre_model("numpy", work_dir)
+        npz_path = configs[0]["weights_path"]
+        mmap_path = os.path.join(work_dir, "MULTI_synthetic.weights")
+        NumpyDecoder.load(npz_path).save(mmap_path)
+        mmap_config = write_config(configs, mmap_path, work_dir, "mmap")
+        npz_config = write_config(configs, npz_path, work_dir, "npz")
+        prompts = synthetic_prompts(tokenizer, args.requests)
+
+        print(f"{'workers':>7} {'startup (s)':>12} {'poems/s':>9} {'speedup':>8} {'RSS (MB)':>9} {'PSS (MB)':>9}")
+        baseline = None
+        for num_workers in args.workers:
+            result = run(mmap_config, num_workers, args.concurrency, prompts, args.clients)
+            baseline = baseline or result["poems_per_second"]
+            print(f"{num_workers:>7} {result['startup_seconds']:>12.2f} {result['poems_per_second']:>9.1f} "
+                  f"{result['poems_per_second'] / baseline:>7.2f}x {result['Rss']:>9.0f} {result['Pss']:>9.0f}")
+
+        num_workers = max(args.workers)
+        npz = run(npz_config, num_workers, args.concurrency, prompts[:args.clients], args.clients)
+        print(f"{num_workers} workers with .npz weights (private copies): RSS {npz['Rss']:.0f} MB, "
+              f"PSS {npz['Pss']:.0f} MB; weights {NumpyDecoder.load(npz_path).nbytes / 2 ** 20:.1f} MB per copy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Export the `.keras` models listed in poem_config.json to plain `.npz` weights
+
+For each entry this script:
+- Loads the Keras model and writes its weights next to it (`*.npz`)
+- Checks that NumpyDecoder gives the same next-token distributions as the Keras model
+- Optionally compares startup time and peak memory of the two backends (`--compare`)
+- Optionally writes int8 per-channel quantized weights as well (`--int8`, `*.int8.npz`)
+- Optionally writes the weights as directories of `.npy` files as well (`--mmap`, `*.weights/`),
+  which are memory-mapped when loaded, so worker processes serving them share one copy
+
+To serve an exported genre without TensorFlow, add `"weights_path"` to its entry
+in poem_config.json; for the int8 weights, point it at the `.int8.npz` file and add
+`"quantization": "int8"`. `weights_path` may also name a `*.weights/` directory.
+
+Run:
+  python export_weights.py
+  python export_weights.py -g WUJUE --compare
+  python export_weights.py --int8
+  python export_weights.py --int8 --mmap
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from benchmarks.startup import run_startup_script
+from poem.genre import Genre
+from poem.numpy_decoder import NumpyDecoder, export_weights
+from poem.quantization import QuantizedDecoder
+
+PARITY_TOLERANCE = 1e-4
+
+# Measured in a fresh interpreter (see benchmarks.startup) so that imports are included in the startup time
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+if sys.argv[1] == "keras":
+    from keras import models
+    model = models.load_model(sys.argv[2], compile=False)
+else:
+    from poem.numpy_decoder import NumpyDecoder
+    model = NumpyDecoder.load(sys.argv[2])
+result = {"seconds": time.perf_counter() - start}
+"""
+
+
+def weights_path_for(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def int8_weights_path_for(weights_path: str) -> str:
+    return os.path.splitext(weights_path)[0] + ".int8.npz"
+
+
+def weights_directory_for(weights_path: str) -> str:
+    return os.path.splitext(weights_path)[0] + ".weights"
+
+
+def check_parity(generation_model, decoder: NumpyDecoder, genre: Genre, batch_size: int = 4, seed: int = 0) -> float:
+    """
+    Compare the next-token distributions of both backends at every position of random sequences.
+
+    :return: float, the max absolute difference of the probabilities
+    """
+    rng = np.random.default_rng(seed)
+    token_ids = rng.integers(1, decoder.vocabulary_size, size=(batch_size, genre.length - 1))
+    expected = generation_model.predict(token_ids, verbose=0)
+
+    state = decoder.initial_state(batch_size)
+    max_diff = 0.0
+    for t in range(token_ids.shape[1]):
+        state = decoder.step(token_ids[:, t:t + 1], state)
+        max_diff = max(max_diff, float(np.max(np.abs(decoder.project(state) - expected[:, t]))))
+    return max_diff
+
+
+def measure_startup(backend: str, path: str) -> dict:
+    return run_startup_script(_STARTUP_SCRIPT, backend, os.path.abspath(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 .keras 模型权重为 .npz，供纯 NumPy 推理使用")
+    parser.add_argument("-c", "--config", default="poem_config.json", help="配置文件（默认 poem_config.json）")
+    parser.add_argument("-g", "--genre", action="append", help="只导出指定体裁，可重复；默认导出全部")
+    parser.add_argument("--compare", action="store_true", help="对比两种后端的启动时间与内存峰值")
+    parser.add_argument("--int8", action="store_true", help="同时导出 int8 逐通道量化的权重（*.int8.npz）")
+    parser.add_argument("--mmap", action="store_true",
+                        help="同时把权重导出为可内存映射的 .npy 目录（*.weights/），供多个工作进程共享")
+    args = parser.parse_args()
+
+    from keras import models
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config_dicts = json.load(f)
+
+    for config in config_dicts:
+        if args.genre and config['genre'] not in args.genre:
+            continue
+        genre = Genre[config['genre']]
+        model_path = config['model_path']
+        weights_path = config.get('weights_path') or weights_path_for(model_path)
+
+        generation_model = models.load_model(model_path, compile=False)
+        export_weights(generation_model, weights_path)
+        print(f"[INFO] {genre.name}: weights saved to: {weights_path}")
+
+        max_diff = check_parity(generation_model, NumpyDecoder.load(weights_path), genre)
+        status = "OK" if max_diff < PARITY_TOLERANCE else "MISMATCH"
+        print(f"[INFO] {genre.name}: parity {status}, max |Δp| = {max_diff:.2e}")
+        if max_diff >= PARITY_TOLERANCE:
+            raise SystemExit(1)
+
+        decoder = NumpyDecoder.load(weights_path)
+        if args.mmap:
+            directory = weights_directory_for(weights_path)
+            decoder.save(directory)
+            print(f"[INFO] {genre.name}: memory-mappable weights saved to: {directory}")
+
+        if args.int8:
+            quantized = QuantizedDecoder.load(weights_path)
+            int8_path = int8_weights_path_for(weights_path)
+            quantized.save(int8_path)
+            print(f"[INFO] {genre.name}: int8 weights saved to: {int8_path} "
+                  f"({decoder.nbytes / 2 ** 20:.1f} MB -> {quantized.nbytes / 2 ** 20:.1f} MB)")
+            if args.mmap:
+                directory = weights_directory_for(int8_path)
+                quantized.save(directory)
+                print(f"[INFO] {genre.name}: memory-mappable int8 weights saved to: {directory}")
+
+        if args.compare:
+            for backend, path in (("keras", model_path), ("numpy", weights_path)):
+                stats = measure_startup(backend, path)
+                print(f"[INFO] {genre.name}: {backend:>5} startup = {stats['seconds']:.2f}s, "
+                      f"peak RSS = {stats['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk poem generation without the UI
+
+Reads prompts (one per line) from a file or stdin and writes K poems per prompt and genre
+to a JSONL file, one line per (prompt, genre):
+
+  {"line": 3, "prompt": "海外", "genre": "WUJUE", "poems": ["...", "..."]}
+
+- The genres are loaded from poem_config.json in each of `--workers` processes
+- Each task decodes a chunk of prompts together as one batch (`--chunk-size` prompts x K rows)
+- Results are written as soon as their chunk completes, so the output is not in input order;
+  only a bounded number of chunks is in flight, so memory does not grow with the input
+- The run parameters are saved next to the output (`<output>.run.json`). With `--resume`, they
+  must match the saved ones; prompts already in the output file are then skipped (a torn last
+  line from an interrupted run is dropped first)
+- With `--seed`, each poem gets its own generator seeded from (seed, line, genre, sample) and
+  draws only from it within the chunk's batch, so the poems do not depend on chunking, worker
+  count or resuming
+
+Run:
+  python generate.py -g WUJUE -k 4 -i prompts.txt -o poems.jsonl
+  cat prompts.txt | python generate.py -g WUJUE -g QILV -o poems.jsonl --resume --seed 42
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from poem.config import PoemConfig, read_config_dicts
+from poem.generator import PoemGenerator
+from poem.genre import Genre
+
+# Progress is printed to stderr at most this often
+PROGRESS_INTERVAL_SECONDS = 10.0
+
+_generators = {}
+
+
+def _init_worker(config_dicts: list[dict], constrained: bool, forced_punctuation: bool):
+    for config in config_dicts:
+        cfg = PoemConfig.from_config(config)
+        cfg.check()
+        _generators[cfg.genre.name] = PoemGenerator(cfg.genre, cfg.tokenizer, cfg.generation_model,
+                                                    constrained=constrained, forced_punctuation=forced_punctuation)
+
+
+def generate_chunk(genre_name: str, items: list[tuple[int, str]], num_samples: int, temperature: float,
+                   seed: int | None, decoding: str, beam_width: int) -> list[dict]:
+    """
+    Generate `num_samples` poems for each (line, prompt) of `items` in one genre.
+    """
+    generator = _generators[genre_name]
+    if decoding == "beam":
+        poems = [generator.beam_search(prompt, beam_width, num_samples) for _, prompt in items]
+    else:
+        rng = None
+        if seed is not None:
+            genre_index = list(Genre).index(Genre[genre_name])
+            rng = [np.random.default_rng([seed, line, genre_index, sample])
+                   for line, _ in items for sample in range(num_samples)]
+        # All prompts of the chunk as one batch
+        rows = generator.generate_batch([prompt for _, prompt in items for _ in range(num_samples)],
+                                        [temperature] * (len(items) * num_samples), rng)
+        poems = [rows[k * num_samples:(k + 1) * num_samples] for k in range(len(items))]
+    return [{"line": line, "prompt": prompt, "genre": genre_name, "poems": samples}
+            for (line, prompt), samples in zip(items, poems)]
+
+
+def read_prompts(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """
+    (line number, prompt) for each non-empty line, numbered from 1.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        prompt = line.strip()
+        if prompt:
+            yield line_number, prompt
+
+
+def load_completed(output_path: str) -> set[tuple[int, str]]:
+    """
+    The (line, genre) pairs already written to `output_path`. A torn last line is truncated away.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "rb+") as f:
+        valid_bytes = 0
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError:
+                break
+            completed.add((record["line"], record["genre"]))
+            valid_bytes += len(raw)
+        f.truncate(valid_bytes)
+    return completed
+
+
+def run_parameters_path(output_path: str) -> str:
+    return output_path + ".run.json"
+
+
+def check_run_parameters(output_path: str, parameters: dict) -> str | None:
+    """
+    Save the parameters of this run next to `output_path`, or, when the output already exists,
+    compare them with the saved ones. Returns an error message if appending would mix results
+    generated with different parameters.
+    """
+    path = run_parameters_path(output_path)
+    if os.path.exists(output_path):
+        if not os.path.exists(path):
+            return f"缺少运行参数文件 {path}，无法确认 {output_path} 的生成参数"
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        changed = [f"{name}: {saved.get(name)!r} -> {value!r}" for name, value in parameters.items()
+                   if saved.get(name) != value]
+        if changed:
+            return f"与写入 {output_path} 时的参数不同：{'; '.join(changed)}"
+        return None
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(parameters, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return None
+
+
+def iter_tasks(prompts: Iterator[tuple[int, str]], genre_names: list[str], chunk_size: int,
+               completed: set) -> Iterator[tuple[str, list[tuple[int, str]]]]:
+    while chunk := list(islice(prompts, chunk_size)):
+        for genre_name in genre_names:
+            items = [(line, prompt) for line, prompt in chunk if (line, genre_name) not in completed]
+            if items:
+                yield genre_name, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成诗歌：从文件或标准输入读取提示词，结果以 JSONL 写出")
+    parser.add_argument("-c", "--config", default="poem_config.json", help="配置文件（默认 poem_config.json）")
+    parser.add_argument("-g", "--genre", action="append", choices=[g.name for g in Genre],
+                        help="体裁，可重复；默认为配置文件中的全部体裁")
+    parser.add_argument("-i", "--input", default="-", help="提示词文件，每行一个（默认 - 表示标准输入）")
+    parser.add_argument("-o", "--output", required=True, help="输出的 JSONL 文件")
+    parser.add_argument("-k", "--num-samples", type=int, default=1, help="每个提示词每种体裁生成的诗数（默认 1）")
+    parser.add_argument("-t", "--temperature", type=float, default=1.0, help="采样温度（默认 1.0，0 为贪心）")
+    parser.add_argument("--decoding", choices=["sample", "beam"], default="sample", help="解码方式（默认 sample）")
+    parser.add_argument("--beam-width", type=int, default=4, help="束搜索的束宽（默认 4）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子；指定后结果可复现")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="工作进程数（默认每个 CPU 一个）")
+    parser.add_argument("--chunk-size", type=int, default=16, help="每个任务一起解码的提示词数（默认 16）")
+    parser.add_argument("--resume", action="store_true", help="跳过输出文件中已有的结果，继续写入")
+    parser.add_argument("--no-constrained", dest="constrained", action="store_false",
+                        help="关闭结构约束解码（默认开启，与 app.py 相同）")
+    parser.add_argument("--forced-punctuation", action="store_true", help="行末直接按“，”“。”交替填入标点")
+    args = parser.parse_args()
+    for name in ("num_samples", "beam_width", "workers", "chunk_size"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} 必须为正整数")
+
+    config_dicts = read_config_dicts(args.config)
+    configured = [config['genre'] for config in config_dicts]
+    genre_names = args.genre or configured
+    missing = [name for name in genre_names if name not in configured]
+    if missing:
+        parser.error(f"配置文件中没有体裁：{', '.join(missing)}")
+    config_dicts = [config for config in config_dicts if config['genre'] in genre_names]
+
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f"输出文件已存在：{args.output}（使用 --resume 继续写入）")
+    # Everything that changes the poems; a resumed run must use the same values
+    parameters = {"genres": sorted(genre_names), "num_samples": args.num_samples, "decoding": args.decoding,
+                  "temperature": args.temperature, "seed": args.seed, "beam_width": args.beam_width,
+                  "constrained": args.constrained, "forced_punctuation": args.forced_punctuation}
+    error = check_run_parameters(args.output, parameters)
+    if error:
+        parser.error(error)
+    completed = load_completed(args.output) if args.resume else set()
+    if completed:
+        print(f"[INFO] Resuming: {len(completed)} (prompt, genre) results already in {args.output}", file=sys.stderr)
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    tasks = iter_tasks(read_prompts(input_file), genre_names, args.chunk_size, completed)
+    # Fresh interpreters rather than forks of this one; bounded number of chunks in flight
+    executor = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=(config_dicts, args.constrained, args.forced_punctuation))
+    max_in_flight = 2 * args.workers
+    poems_written = 0
+    start = last_report = time.perf_counter()
+    try:
+        with executor, open(args.output, "a", encoding="utf-8") as output:
+            in_flight = set()
+            while True:
+                for genre_name, items in islice(tasks, max_in_flight - len(in_flight)):
+                    in_flight.add(executor.submit(generate_chunk, genre_name, items, args.num_samples,
+                                                  args.temperature, args.seed, args.decoding, args.beam_width))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for record in future.result():
+                        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        poems_written += len(record["poems"])
+                output.flush()
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    last_report = now
+                    print(f"[INFO] {poems_written} poems, {poems_written / (now - start):.1f} poems/sec", file=sys.stderr)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] Wrote {poems_written} poems to {args.output} in {elapsed:.1f}s "
+          f"({poems_written / elapsed:.1f} poems/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from poem import metrics
+from poem.cache import LRUCache
+from poem.generator import PoemGenerator
+
+
+class SchedulerClosed(RuntimeError):
+    pass
+
+
+class _Request(NamedTuple):
+    prompt: str
+    temperature: float
+    num_samples: int
+    seed: object
+    decoding: str
+    beam_width: int
+    future: Future
+    partials: queue.Queue = None
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of a single PoemGenerator.
+
+    Requests are queued and a worker thread collects them for up to `max_wait_ms`
+    (or until `max_batch_size` poems are requested), then decodes them together
+    with `PoemGenerator.generate_batch`. Each caller only gets its own poems back.
+
+    Requests with a seed are decoded as a batch of their own, so that their
+    sampling stays reproducible regardless of what else is in flight. Beam search
+    requests already decode their beams as a batch and are run one at a time.
+
+    Deterministic requests (temperature 0, a seed, or beam search) are answered from
+    `result_cache` when given; its keys include the genre so one cache can be shared.
+    """
+
+    def __init__(self, generator: PoemGenerator, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 result_cache: LRUCache = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 必须为正整数")
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.result_cache = result_cache
+        self._queue = queue.Queue()
+        self._closed = False
+        # Held while checking `_closed` and queueing, so no request lands behind the closing sentinel
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"batch-{generator.genre.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+               decoding: str = "sample", beam_width: int = 4, partials: queue.Queue = None) -> Future:
+        """
+        Queue a request; the future resolves to the list of `num_samples` generated poems.
+
+        With `partials`, the formatted partial poems are also put on that queue after each
+        decoding step (sampling only).
+        """
+        if self._closed:
+            raise SchedulerClosed("BatchScheduler 已关闭")
+        if num_samples < 1:
+            raise ValueError("num_samples 必须为正整数")
+        if decoding not in ("sample", "beam"):
+            raise ValueError(f"未知的解码方式：{decoding}")
+        genre_name = self.generator.genre.name
+        metrics.count_request(genre_name)
+        future = Future()
+        if metrics.ENABLED:
+            start = time.perf_counter()
+            future.add_done_callback(lambda _: metrics.observe_request(genre_name, time.perf_counter() - start))
+        cache_key = self._cache_key(prompt, temperature, num_samples, seed, decoding, beam_width)
+        if cache_key is not None:
+            poems = self.result_cache.get(cache_key)
+            if poems is not None:
+                future.set_result(list(poems))
+                return future
+            future.add_done_callback(lambda f: self._store_result(cache_key, f))
+        with self._lock:
+            if self._closed:
+                raise SchedulerClosed("BatchScheduler 已关闭")
+            self._queue.put(_Request(prompt, temperature, num_samples, seed, decoding, beam_width, future, partials))
+        return future
+
+    def stream(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+               decoding: str = "sample", beam_width: int = 4) -> Iterator[str]:
+        """
+        Queue a request and return an iterator over the formatted partial poems, one per
+        decoding step; the last item is the finished result. The request is queued right
+        away, so a closed scheduler raises here rather than on iteration.
+        """
+        partials = queue.Queue()
+        future = self.submit(prompt, temperature, num_samples, seed, decoding, beam_width, partials)
+        future.add_done_callback(lambda _: partials.put(None))
+
+        def iterate():
+            last = None
+            while (partial := partials.get()) is not None:
+                last = partial
+                yield partial
+            # Sampling already streamed the finished poems; cached and beam search results were not streamed
+            result = self._format(future.result())
+            if result != last:
+                yield result
+        return iterate()
+
+    def _store_result(self, cache_key: tuple, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.result_cache.put(cache_key, tuple(future.result()))
+
+    def _cache_key(self, prompt: str, temperature: float, num_samples: int, seed, decoding: str, beam_width: int):
+        if self.result_cache is None or not isinstance(seed, (int, type(None))):
+            return None
+        if decoding == "beam":
+            return self.generator.genre.name, prompt, num_samples, decoding, beam_width
+        if temperature == 0 or seed is not None:
+            return self.generator.genre.name, prompt, num_samples, decoding, temperature, seed
+        return None
+
+    def generate(self, prompt: str, temperature: float = 1.0) -> str:
+        return self.submit(prompt, temperature).result()[0]
+
+    def generate_samples(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None) -> list[str]:
+        return self.submit(prompt, temperature, num_samples, seed).result()
+
+    def generate_and_format(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+                            decoding: str = "sample", beam_width: int = 4) -> str:
+        return self._format(self.submit(prompt, temperature, num_samples, seed, decoding, beam_width).result())
+
+    def _format(self, poems: list[str]) -> str:
+        return "\n\n".join(self.generator.format_poem(poem) for poem in poems)
+
+    def queue_depth(self) -> int:
+        """
+        Number of requests waiting to be collected into a batch.
+        """
+        return self._queue.qsize()
+
+    def close(self):
+        """
+        Stop accepting requests; already queued requests are still served.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def _collect_batch(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        rows = first.num_samples
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the sentinel so the loop stops after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+            rows += item.num_samples
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            unseeded = [request for request in batch if request.decoding == "sample" and request.seed is None]
+            if unseeded:
+                self._decode(unseeded, rng=None)
+            for request in batch:
+                if request.decoding == "beam":
+                    self._beam_search(request)
+                elif request.seed is not None:
+                    self._decode([request], rng=np.random.default_rng(request.seed))
+
+    def _beam_search(self, request: _Request):
+        try:
+            poems = self.generator.beam_search(request.prompt, request.beam_width, request.num_samples)
+        except Exception as e:
+            request.future.set_exception(e)
+            return
+        request.future.set_result(poems)
+
+    def _decode(self, requests: list, rng):
+        prompts = [request.prompt for request in requests for _ in range(request.num_samples)]
+        temperatures = [request.temperature for request in requests for _ in range(request.num_samples)]
+        offsets = np.cumsum([0] + [request.num_samples for request in requests])
+        streaming = [(request, offsets[k]) for k, request in enumerate(requests) if request.partials is not None]
+        generator = self.generator
+        timer = metrics.stage_timer(self.generator.genre.name)
+        try:
+            for rows in generator.stream_batch(prompts, temperatures, rng, timer):
+                for request, offset in streaming:
+                    poems = [generator.decode(generated, request.prompt)
+                             for generated in rows[offset:offset + request.num_samples]]
+                    request.partials.put(self._format(poems))
+            with timer.stage("decoding"):
+                poems = [generator.decode(generated, prompt) for generated, prompt in zip(rows, prompts)]
+            timer.observe()
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        for k, request in enumerate(requests):
+            request.future.set_result(poems[offsets[k]:offsets[k + 1]])
@@ -1,32 +1,71 @@
 import os
 import json
-from keras import Model, models, layers
+import threading
+import weakref
+from typing import Callable, Hashable
+
 from poem.genre import Genre
+from poem.tokenizer import Tokenizer
+
+# -------- 共享加载 --------
+# 多个体裁指向同一词表 / 模型文件时（多体裁模型）只加载一份；没有体裁再引用时自动释放
+_shared = weakref.WeakValueDictionary()
+_shared_locks = {}
+_shared_locks_guard = threading.Lock()
+
+def _load_shared(key: Hashable, load: Callable[[], object]):
+    with _shared_locks_guard:
+        lock = _shared_locks.setdefault(key, threading.Lock())
+    with lock:
+        loaded = _shared.get(key)
+        if loaded is None:
+            loaded = load()
+            _shared[key] = loaded
+        return loaded
 
 # -------- 词表加载 --------
-def load_text_vectorization(path):
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"未找到词表：{path}")
-    with open(path, "r", encoding="utf-8") as f:
-        vocab = [line.rstrip("\n") for line in f]
-    if not vocab:
-        raise ValueError("词表为空")
-
-    tv = layers.TextVectorization(
-        standardize=None,
-        split='character',
-        output_mode="int",
-        output_sequence_length=None,
-        ragged = True
-    )
-    tv.set_vocabulary(vocab)
-    return tv
+def load_tokenizer(path) -> Tokenizer:
+    return _load_shared(("vocabulary", os.path.abspath(path)), lambda: Tokenizer.load(path))
+
+# -------- 模型加载 --------
+def load_generation_model(config: dict):
+    """
+    配置了 weights_path（由 export_weights.py 导出）时使用纯 NumPy 推理，无需加载 Keras 模型。
+    再配置 "quantization": "int8" 时使用 int8 权重（QuantizedDecoder）；权重文件本身已是 int8 量化权重
+    （export_weights.py --int8 导出，带 *_scale 数组）时，未配置 quantization 也使用 QuantizedDecoder。
+    """
+    weights_path = config.get('weights_path')
+    quantization = config.get('quantization')
+    if quantization not in (None, "int8"):
+        raise ValueError(f"不支持的量化方式：{quantization}")
+    if quantization and not weights_path:
+        raise ValueError("quantization 需要同时配置 weights_path")
+    if weights_path:
+        if not os.path.exists(weights_path):
+            raise FileNotFoundError(f"未找到权重文件：{weights_path}")
+        from poem.quantization import QuantizedDecoder, is_quantized
+        if quantization is None and is_quantized(weights_path):
+            print(f"[INFO] {weights_path} 为 int8 量化权重，使用 QuantizedDecoder")
+            quantization = "int8"
+        if quantization == "int8":
+            return _load_shared(("int8", os.path.abspath(weights_path)), lambda: QuantizedDecoder.load(weights_path))
+        from poem.numpy_decoder import NumpyDecoder
+        return _load_shared(("weights", os.path.abspath(weights_path)), lambda: NumpyDecoder.load(weights_path))
+
+    from keras import models
+    model_path = config['model_path']
+    return _load_shared(("model", os.path.abspath(model_path)),
+                        lambda: models.load_model(model_path, compile=False))
+
+def model_output_dim(generation_model) -> int:
+    if hasattr(generation_model, 'vocabulary_size'):
+        return generation_model.vocabulary_size
+    return generation_model.output_shape[-1]
 
 class PoemConfig:
-    def __init__(self, genre: Genre, vectorization_model: layers.TextVectorization,
-                 generation_model: Model, meta: dict):
+    def __init__(self, genre: Genre, tokenizer: Tokenizer, generation_model, meta: dict):
         self.genre = genre
-        self.vectorization_model = vectorization_model
+        self.tokenizer = tokenizer
         self.generation_model = generation_model
         self.meta = meta
 
@@ -36,27 +75,40 @@ class PoemConfig:
         genre = Genre[genre_name]
 
         vocabulary_path = config['vocabulary_path']
-        vectorization_model = load_text_vectorization(vocabulary_path)
+        tokenizer = load_tokenizer(vocabulary_path)
 
-        model_path = config['model_path']
-        generation_model = models.load_model(model_path, compile=False)
+        generation_model = load_generation_model(config)
 
         return PoemConfig(
             genre=genre,
-            vectorization_model=vectorization_model,
+            tokenizer=tokenizer,
             generation_model=generation_model,
             meta=config
         )
 
-def read_configs():
-    config_path = "poem_config.json"
+    def check(self):
+        """
+        一致性校验：模型输出维度应等于词表大小
+        """
+        vocab_size = self.tokenizer.vocabulary_size
+        out_dim = model_output_dim(self.generation_model)
+        if out_dim != vocab_size:
+            raise ValueError(
+                f"体裁“{self.genre.genre_name}”的模型输出维度({out_dim})与词表大小({vocab_size})不一致，请检查该体裁的配置。"
+            )
+
+def read_config_dicts(config_path="poem_config.json"):
+    """
+    只读取配置项，不加载词表与模型
+    """
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"未找到配置文件：{config_path}")
 
     with open(config_path, "r", encoding="utf-8") as f:
-        config_dicts = json.load(f)
+        return json.load(f)
 
-    configs = [PoemConfig.from_config(cfg) for cfg in config_dicts]
+def read_configs():
+    configs = [PoemConfig.from_config(cfg) for cfg in read_config_dicts()]
     return configs
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import threading
+import weakref
+
+import numpy as np
+from keras import Model, backend, layers, ops
+
+from poem.numpy_decoder import softmax
+
+
+class KerasStepDecoder:
+    """
+    Incremental decoder built on the layers of a trained `lstm_decoder` model.
+
+    Instead of re-running the whole prefix at every step, the LSTM hidden/cell
+    state is carried between calls, so each step only feeds the new tokens.
+    The layers are looked up by the names given in `train/generation_model.build_model`:
+    `embedding`, `lstm` and `output`. Dropout is skipped since it is the identity at inference.
+
+    State is a tuple of numpy float32 arrays `(h, c)`, each of shape (batch_size, units).
+
+    With the TensorFlow backend, the step and output layer run as `tf.function`s whose input
+    signatures leave the batch size and number of steps open: each is traced once (see
+    `warm_up`) and reused for every batch size and prompt length.
+    """
+
+    def __init__(self, generation_model: Model):
+        embedding = generation_model.get_layer("embedding")
+        lstm = generation_model.get_layer("lstm")
+        self.output_layer = generation_model.get_layer("output")
+        self.output_kernel, self.output_bias = self.output_layer.get_weights()
+        self.units = lstm.units
+        self.vocabulary_size = self.output_layer.units
+
+        # A copy of the LSTM layer that also returns its final state, sharing the trained weights
+        lstm_config = dict(lstm.get_config(), name="lstm_step", return_sequences=False, return_state=True)
+        step_lstm = layers.LSTM.from_config(lstm_config)
+
+        token_ids = layers.Input(shape=(None,), dtype="int32", name="token_ids")
+        state_h = layers.Input(shape=(self.units,), name="state_h")
+        state_c = layers.Input(shape=(self.units,), name="state_c")
+        x = embedding(token_ids)
+        _, h, c = step_lstm(x, initial_state=[state_h, state_c])
+        step_lstm.set_weights(lstm.get_weights())
+        self.step_model = Model(inputs=[token_ids, state_h, state_c], outputs=[h, c], name="lstm_step_decoder")
+
+        self._step = lambda token_ids, h, c: self.step_model([token_ids, h, c], training=False)
+        self._project = self.output_layer
+        if backend.backend() == "tensorflow":
+            import tensorflow as tf
+            state_spec = tf.TensorSpec((None, self.units), tf.float32)
+            self._step = tf.function(self._step, input_signature=[tf.TensorSpec((None, None), tf.int32),
+                                                                  state_spec, state_spec])
+            self._project = tf.function(self._project, input_signature=[state_spec])
+
+    def initial_state(self, batch_size: int) -> tuple:
+        zeros = np.zeros((batch_size, self.units), dtype=np.float32)
+        return zeros, zeros.copy()
+
+    def step(self, token_ids: np.ndarray, state: tuple) -> tuple:
+        """
+        Feed token ids of shape (batch_size, steps) and return the new state.
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int32)
+        h, c = (np.asarray(s, dtype=np.float32) for s in state)
+        h, c = self._step(token_ids, h, c)
+        return ops.convert_to_numpy(h), ops.convert_to_numpy(c)
+
+    def project(self, state: tuple, candidate_ids: np.ndarray = None) -> np.ndarray:
+        """
+        Next-token probabilities of shape (batch_size, vocabulary_size) for the given state.
+
+        With `candidate_ids`, only those columns of the output layer are computed and the
+        softmax is taken over them alone: shape (batch_size, len(candidate_ids)).
+        """
+        if candidate_ids is not None:
+            return softmax(state[0] @ self.output_kernel[:, candidate_ids] + self.output_bias[candidate_ids])
+        return ops.convert_to_numpy(self._project(np.asarray(state[0], dtype=np.float32)))
+
+    def warm_up(self):
+        """
+        Trace the step and output functions now rather than on the first request.
+        """
+        self.project(self.step(np.zeros((1, 1), dtype=np.int32), self.initial_state(1)))
+
+
+_step_decoders = weakref.WeakKeyDictionary()
+_step_decoders_lock = threading.Lock()
+
+
+def step_decoder_for(generation_model: Model) -> KerasStepDecoder:
+    """
+    The KerasStepDecoder of a model, built once and shared by every PoemGenerator using that
+    model (e.g. all genres of a multi-genre model).
+    """
+    with _step_decoders_lock:
+        decoder = _step_decoders.get(generation_model)
+        if decoder is None:
+            decoder = _step_decoders[generation_model] = KerasStepDecoder(generation_model)
+        return decoder
@@ -1,36 +1,164 @@
+import time
+from typing import TYPE_CHECKING, Iterator
+
 import numpy as np
-from keras import Model, layers
 
-from poem.genre import Genre
+from poem import metrics
+from poem.cache import LRUCache
+from poem.genre import Genre, PUNCTUATIONS
+from poem.tokenizer import OOV_ID, PADDING_ID, Tokenizer
+
+if TYPE_CHECKING:
+    from keras import Model
 
 
 # -------- 采样函数 --------
-def sampling(predictions: list, temperature=1.0, eps1=1e-20, eps2=1e-9) -> int:
+def sample_batch(predictions, temperatures, rng: np.random.Generator = None,
+                 eps1=1e-20, eps2=1e-9) -> np.ndarray:
+    """
+    Sample one token id per row of an (N, vocab) probability matrix in a single NumPy pass.
+
+    :param predictions: array-like of shape (N, vocab), the next-token probabilities
+    :param temperatures: float or array-like of shape (N,), the temperature of each row
+    :param rng: np.random.Generator, or a list of N Generators, one per row, optional.
+        Uses the global NumPy random state if omitted
+    :return: np.ndarray of shape (N,), the sampled token ids
+    """
     p = np.asarray(predictions, dtype=np.float64)
+    t = np.broadcast_to(np.asarray(temperatures, dtype=np.float64), p.shape[:1])[:, None]
 
     # The two key points: log(p + eps1) divide by (T + eps2)
-    logits = np.log(p + eps1) / (float(temperature) + eps2)
+    logits = np.log(p + eps1) / (t + eps2)
 
-    # Subtract the max logit to prevent overflow
-    logits -= np.max(logits)
+    # Subtract the max logit of each row to prevent overflow
+    logits -= np.max(logits, axis=1, keepdims=True)
 
-    q = np.exp(logits)
-    q /= q.sum()
-    return int(np.random.choice(len(q), p=q))
+    # Inverse-CDF sampling on the unnormalized cumulative weights
+    cdf = np.cumsum(np.exp(logits), axis=1)
+    if isinstance(rng, list):
+        u = np.array([row_rng.random() for row_rng in rng])
+    else:
+        u = rng.random(len(p)) if rng is not None else np.random.random(len(p))
+    u *= cdf[:, -1]
+    token_ids = np.argmax(cdf > u[:, None], axis=1)
+    return token_ids
 
 
 class PoemGenerator:
-    def __init__(self, genre: Genre, vectorization_model: layers.TextVectorization, generation_model: Model):
+    def __init__(self, genre: Genre, tokenizer: Tokenizer, generation_model: "Model",
+                 incremental: bool = True, constrained: bool = False, forced_punctuation: bool = False,
+                 prefix_cache: LRUCache = None):
+        """
+        :param generation_model: a Keras `lstm_decoder` model, or a decoder object such as
+            NumpyDecoder that provides `initial_state`/`step`/`project`
+        :param constrained: structure-aware decoding. At the fixed punctuation positions of the genre
+            only punctuation is sampled (softmax over the punctuation columns alone); everywhere else
+            punctuation is masked out. Padding, [UNK] and genre tokens are never sampled
+        :param forced_punctuation: with `constrained`, write "，" / "。" at alternating line ends
+            without running the output layer at all
+        :param prefix_cache: optional LRUCache of the decoder state after encoded prompts, keyed by
+            (genre name, prompt ids). A prompt only encodes what follows its longest cached prefix
+
+        If the vocabulary contains the token of the genre (`Genre.token`), the model is a multi-genre
+        model conditioned on it: every row starts with that token, which is stripped from the poems.
+
+        Prompt characters outside the vocabulary are fed to the model as [UNK], as in training
+        with a pruned vocabulary, and kept as typed in the poems.
+        """
         self.genre = genre
-        self.vectorization_model = vectorization_model
+        self.tokenizer = tokenizer
         self.generation_model = generation_model
+        # 增量解码：在步与步之间保留 LSTM 状态，每步只输入一个新 token
+        self._decoder = generation_model if hasattr(generation_model, "project") else None
+        self.incremental = incremental or self._decoder is not None
+        if constrained and not self.incremental:
+            raise ValueError("constrained 解码需要增量解码（incremental=True）")
+        self.constrained = constrained
+        self.forced_punctuation = forced_punctuation
+        self.prefix_cache = prefix_cache
+
+        # 多体裁模型：每行以体裁 token 开头，诗句的位置整体后移
+        genre_token_ids = [i for i in tokenizer.encode("".join(g.token for g in Genre)) if i != OOV_ID]
+        self._prefix_ids = [i for i in tokenizer.encode(genre.token) if i != OOV_ID]
+        offset = len(self._prefix_ids)
+        self._sequence_length = offset + genre.length
+        punctuation_positions = [offset + position for position in genre.punctuation_positions]
+
+        # 结构约束：标点位置、可选标点 id 与需要屏蔽的 id（体裁 token 也从不生成）
+        self._punctuation_slots = np.zeros(self._sequence_length, dtype=bool)
+        self._punctuation_slots[punctuation_positions] = True
+        self._punctuation_ids = np.array([i for i in tokenizer.encode(PUNCTUATIONS) if i != OOV_ID])
+        self._never_ids = np.array([PADDING_ID, OOV_ID] + genre_token_ids)
+        self._masked_ids = np.concatenate([self._never_ids, self._punctuation_ids]).astype(int)
+        comma_id, period_id = tokenizer.encode("，。")
+        self._forced_ids = np.full(self._sequence_length, period_id)
+        self._forced_ids[punctuation_positions[::2]] = comma_id
+        if forced_punctuation and OOV_ID in (comma_id, period_id):
+            raise ValueError("词表中缺少“，”或“。”，无法使用 forced_punctuation")
+
+    @property
+    def decoder(self):
+        if self._decoder is None:
+            from poem.decoder import step_decoder_for
+            self._decoder = step_decoder_for(self.generation_model)
+        return self._decoder
 
-    def generate_and_format(self, prompt: str, temperature: float = 1.0) -> str:
-        poem_text = self.generate(prompt, temperature)
+    def encode_prompt(self, prompt: str) -> list[int]:
+        return self._prefix_ids + self.tokenizer.encode(prompt)
+
+    def decode(self, token_ids: list[int], prompt: str = "") -> str:
+        """
+        The poem text of a row of token ids, without the genre token of a multi-genre model.
+        The row starts with the encoded `prompt`, whose characters are kept as typed rather than
+        decoded, so the ones outside the vocabulary do not come back as [UNK].
+        """
+        start = len(self._prefix_ids) + len(prompt)
+        return prompt[:len(token_ids) - len(self._prefix_ids)] + self.tokenizer.decode(token_ids[start:])
+
+    def warm_up(self, batch_size: int = 1) -> tuple[float, float]:
+        """
+        Do the lazy work of the first request now: build the step decoder and trace its step and
+        output functions (`KerasStepDecoder.warm_up`), then generate throwaway poems to initialize
+        the rest of the decoding path (BLAS threads, caches).
+
+        Returns the seconds taken by the first poem, including the tracing (cold), and by the same
+        poem afterwards (warm).
+        """
+        masked_ids = set(self._masked_ids.tolist())
+        prompt = next(token for i, token in enumerate(self.tokenizer.get_vocabulary()) if i not in masked_ids)
+        start = time.perf_counter()
+        if self.incremental and hasattr(self.decoder, "warm_up"):
+            self.decoder.warm_up()
+        timings = []
+        for prompts in ([prompt], [prompt] * batch_size, [prompt]):
+            self.generate_batch(prompts, [1.0] * len(prompts))
+            timings.append(time.perf_counter() - start)
+            start = time.perf_counter()
+        return timings[0], timings[-1]
+
+    def generate_and_format(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+                            decoding: str = "sample", beam_width: int = 4) -> str:
+        """
+        Generate `num_samples` candidate poems and format them, separated by blank lines.
+
+        :param decoding: "sample" for temperature sampling, "beam" for beam search. With beam
+            search the `num_samples` best hypotheses are returned and temperature/seed are unused
+        """
+        if decoding == "beam":
+            poems = self.beam_search(prompt, beam_width, num_samples)
+        elif decoding == "sample":
+            poems = self.generate_samples(prompt, temperature, num_samples, seed)
+        else:
+            raise ValueError(f"未知的解码方式：{decoding}")
+        return "\n\n".join(self.format_poem(poem) for poem in poems)
+
+    def format_poem(self, poem_text: str) -> str:
         poem_cols = self.genre.cols
         poem_length = self.genre.length
 
-        lines = ["".join(poem_text[i:i + poem_cols + 1]) for i in range(0, poem_length, poem_cols + 1)]
+        # Partial poems (while streaming) only produce the lines written so far
+        lines = ["".join(poem_text[i:i + poem_cols + 1])
+                 for i in range(0, min(len(poem_text), poem_length), poem_cols + 1)]
         return "\n".join(lines)
 
     def generate(self, prompt: str, temperature: float = 1.0) -> str:
@@ -40,15 +168,288 @@ class PoemGenerator:
         Returns:
             A generated poem as a string.
         """
-        poem_length = self.genre.length
-        prompt_ids = self.vectorization_model(prompt)[:len(prompt)]
-        generated = list(prompt_ids) # cast to list for appending
+        return self.generate_batch([prompt], [temperature])[0]
+
+    def generate_samples(self, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None) -> list[str]:
+        """
+        Generate several candidate poems for one prompt, decoded together as one batch.
+
+        :param seed: int or np.random.Generator, optional. Makes the sampling reproducible
+        """
+        if num_samples < 1:
+            raise ValueError("num_samples 必须为正整数")
+        rng = np.random.default_rng(seed) if seed is not None else None
+        return self.generate_batch([prompt] * num_samples, [temperature] * num_samples, rng)
+
+    def generate_batch(self, prompts: list[str], temperatures: list[float],
+                       rng: np.random.Generator | list[np.random.Generator] = None) -> list[str]:
+        """
+        Generate one poem per prompt, decoding all rows together as one batch.
+        Each row keeps its own prompt length and temperature.
+
+        :param rng: np.random.Generator shared by the batch, or a list with one Generator per
+            prompt. With a list each row draws only from its own, so its poem does not depend on
+            the other rows of the batch
+
+        Returns:
+            The generated poems, in the same order as the prompts.
+        """
+        timer = metrics.stage_timer(self.genre.name)
+        for rows in self.stream_batch(prompts, temperatures, rng, timer):
+            pass
+        with timer.stage("decoding"):
+            poems = [self.decode(generated, prompt) for generated, prompt in zip(rows, prompts)]
+        timer.observe()
+        return poems
+
+    def stream_batch(self, prompts: list[str], temperatures: list[float],
+                     rng: np.random.Generator | list[np.random.Generator] = None,
+                     timer: "metrics.StageTimer" = None) -> Iterator[list[list[int]]]:
+        """
+        Like `generate_batch`, but yields the token ids of every row after each decoding step.
+        The last value yielded holds the finished poems.
+
+        :param timer: StageTimer to record the stage timings in. The caller then times the
+            decoding of the poems and calls `timer.observe()`; without one, the timings are
+            observed when the generator is exhausted.
+        """
+        if isinstance(rng, list) and len(rng) != len(prompts):
+            raise ValueError("rng 列表的长度必须与提示词数量相同")
+        owns_timer = timer is None
+        if owns_timer:
+            timer = metrics.stage_timer(self.genre.name)
+        poem_length = self._sequence_length
+        with timer.stage("vectorization"):
+            rows = [self.encode_prompt(prompt) for prompt in prompts]
+        prompt_tokens = sum(len(generated) for generated in rows)
+        if self.incremental:
+            temperatures = np.asarray(temperatures, dtype=np.float64)
+            yield from self._iter_incremental(rows, poem_length, temperatures, rng, timer)
+        else:
+            for i, (generated, temperature) in enumerate(zip(rows, temperatures)):
+                yield from self._iter_full(rows, generated, poem_length, temperature, _rows_rng(rng, [i]), timer)
+        metrics.count_tokens(self.genre.name, sum(len(generated) for generated in rows) - prompt_tokens)
+        if owns_timer:
+            timer.observe()
+        yield rows
+
+    def generate_stream(self, prompt: str, temperature: float = 1.0, num_samples: int = 1,
+                        seed=None) -> Iterator[str]:
+        """
+        Yield the formatted partial poems (candidates separated by blank lines) after each token.
+        """
+        rng = np.random.default_rng(seed) if seed is not None else None
+        for rows in self.stream_batch([prompt] * num_samples, [temperature] * num_samples, rng):
+            yield "\n\n".join(self.format_poem(self.decode(generated, prompt)) for generated in rows)
+
+    def beam_search(self, prompt: str, beam_width: int = 4, num_results: int = 1) -> list[str]:
+        """
+        Beam search decoding. All beams advance together as one batched decoder step,
+        and the surviving hypotheses are reordered by gathering their rows.
+
+        The scoring is structure-aware: at the punctuation positions of the genre only
+        punctuation is scored, elsewhere punctuation, padding and [UNK] are excluded.
+        All hypotheses of a genre have the same length, so scores are compared as plain
+        sums of log-probabilities.
+
+        Returns:
+            The `num_results` best poems (at most `beam_width`), best first.
+        """
+        if beam_width < 1:
+            raise ValueError("beam_width 必须为正整数")
+        if not self.incremental:
+            raise ValueError("beam search 需要增量解码（incremental=True）")
+        poem_length = self._sequence_length
+        timer = metrics.stage_timer(self.genre.name)
+        with timer.stage("vectorization"):
+            prompt_ids = self.encode_prompt(prompt)
+        if len(prompt_ids) >= poem_length:
+            return [self.decode(prompt_ids, prompt)]
+
+        decoder = self.decoder
+        with timer.stage("prefill"):
+            state = self._encode_prompts([prompt_ids])
+        beams = np.array([prompt_ids], dtype=np.int64)
+        scores = np.zeros(1)
+        for position in range(len(prompt_ids), poem_length):
+            with timer.stage("predict"):
+                log_probs, candidate_ids = self._beam_log_probs(state, position)
+            total = (scores[:, None] + log_probs).ravel()
+
+            # Top-k over all (beam, candidate) pairs, best first
+            k = min(beam_width, int(np.isfinite(total).sum()))
+            top = np.argpartition(-total, k - 1)[:k]
+            top = top[np.argsort(-total[top], kind="stable")]
+            beam_index, candidate_index = np.divmod(top, len(candidate_ids))
+
+            beams = np.concatenate([beams[beam_index], candidate_ids[candidate_index][:, None]], axis=1)
+            scores = total[top]
+            if position + 1 < poem_length:
+                with timer.stage("predict"):
+                    state = decoder.step(beams[:, -1:], tuple(s[beam_index] for s in state))
+        metrics.count_tokens(self.genre.name, len(beams) * (poem_length - len(prompt_ids)))
+        with timer.stage("decoding"):
+            poems = [self.decode(beam, prompt) for beam in beams[:num_results]]
+        timer.observe()
+        return poems
+
+    def _beam_log_probs(self, state: tuple, position: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Log-probabilities of shape (beams, candidates) for the token at `position`, and the candidate ids.
+        """
+        decoder = self.decoder
+        if self._punctuation_slots[position]:
+            if self.forced_punctuation:
+                return np.zeros((len(state[0]), 1)), self._forced_ids[position:position + 1]
+            return np.log(decoder.project(state, self._punctuation_ids)), self._punctuation_ids
+
+        predictions = np.array(decoder.project(state), dtype=np.float64)
+        predictions[:, self._masked_ids] = 0.0
+        with np.errstate(divide="ignore"):
+            return np.log(predictions), np.arange(predictions.shape[1])
+
+    def _iter_full(self, rows: list[list[int]], generated: list[int], poem_length: int, temperature: float,
+                   rng: np.random.Generator, timer: "metrics.StageTimer") -> Iterator[list[list[int]]]:
+        # Re-run the whole prefix at every step: O(n^2) LSTM steps
         while len(generated) < poem_length:
             input_sequence = np.array(generated).reshape(1, -1)
-            predictions = self.generation_model.predict(input_sequence, verbose=0)[0]
-            next_token_id = sampling(predictions[-1], temperature)
+            with timer.stage("predict"):
+                predictions = self.generation_model.predict(input_sequence, verbose=0)[0]
+            with timer.stage("sampling"):
+                predictions = predictions[-1:]
+                predictions[:, self._never_ids] = 0.0
+                next_token_id = int(sample_batch(predictions, temperature, rng)[0])
             generated.append(next_token_id)
-        return ''.join(self.vectorization_model.get_vocabulary()[token_id] for token_id in generated)
+            # The completed rows are yielded once, by stream_batch
+            if len(generated) < poem_length:
+                yield rows
+
+    def _iter_incremental(self, rows: list[list[int]], poem_length: int, temperatures: np.ndarray,
+                          rng: np.random.Generator, timer: "metrics.StageTimer") -> Iterator[list[list[int]]]:
+        active = [i for i, generated in enumerate(rows) if len(generated) < poem_length]
+        if not active:
+            return
+        decoder = self.decoder
+
+        with timer.stage("prefill"):
+            state = self._encode_prompts([rows[i] for i in active])
+
+        # Then feed one new token per row and step; rows leave the batch once their poem is complete
+        while True:
+            positions = np.array([len(rows[i]) for i in active])
+            next_token_ids = self._next_tokens(state, positions, temperatures[active], _rows_rng(rng, active),
+                                               timer)
+            for i, token_id in zip(active, next_token_ids):
+                rows[i].append(int(token_id))
+            keep = [k for k, i in enumerate(active) if len(rows[i]) < poem_length]
+            if not keep:
+                break
+            yield rows
+            if len(keep) < len(active):
+                active = [active[k] for k in keep]
+                state = tuple(s[keep] for s in state)
+            with timer.stage("predict"):
+                state = decoder.step(np.array([[rows[i][-1]] for i in active]), state)
+
+    def _encode_prompts(self, prompts: list[list[int]]) -> tuple:
+        """
+        Decoder state after each prompt. Each distinct prompt is encoded once, starting from the
+        state of its longest cached prefix, with one decoder call per distinct remaining length.
+        """
+        decoder = self.decoder
+        state = decoder.initial_state(len(prompts))
+        unique_prompts = {}
+        for row, prompt_ids in enumerate(prompts):
+            unique_prompts.setdefault(tuple(prompt_ids), []).append(row)
+
+        # Start each distinct prompt from its longest cached prefix
+        pending = {}
+        for prompt_ids, rows in unique_prompts.items():
+            prefix_length, prefix_state = self._cached_prefix(prompt_ids)
+            if prefix_state is not None:
+                for s, prefix_s in zip(state, prefix_state):
+                    s[rows] = prefix_s
+            if prefix_length < len(prompt_ids):
+                pending.setdefault(len(prompt_ids) - prefix_length, []).append(prompt_ids)
+
+        # Encode the rest, one call per distinct remaining length
+        for length, group in pending.items():
+            first_rows = [unique_prompts[prompt_ids][0] for prompt_ids in group]
+            group_state = decoder.step(np.array([prompt_ids[-length:] for prompt_ids in group]),
+                                       tuple(s[first_rows] for s in state))
+            for k, prompt_ids in enumerate(group):
+                rows = unique_prompts[prompt_ids]
+                for s, group_s in zip(state, group_state):
+                    s[rows] = group_s[k]
+                if self.prefix_cache is not None:
+                    self.prefix_cache.put((self.genre.name, prompt_ids), tuple(group_s[k].copy() for group_s in group_state))
+        return state
+
+    def _cached_prefix(self, prompt_ids: tuple) -> tuple[int, tuple]:
+        cache = self.prefix_cache
+        if cache is None:
+            return 0, None
+        # A miss on the whole prompt may still hit one of its shorter prefixes
+        prefix_state = cache.get((self.genre.name, prompt_ids))
+        if prefix_state is not None:
+            return len(prompt_ids), prefix_state
+        for length in range(len(prompt_ids) - 1, 0, -1):
+            key = (self.genre.name, prompt_ids[:length])
+            if key in cache:
+                prefix_state = cache.get(key)
+                if prefix_state is not None:
+                    return length, prefix_state
+        return 0, None
+
+    def _next_tokens(self, state: tuple, positions: np.ndarray, temperatures: np.ndarray,
+                     rng: np.random.Generator, timer: "metrics.StageTimer") -> np.ndarray:
+        """
+        Pick the next token of each row, given the position it is written to.
+        """
+        decoder = self.decoder
+        if not self.constrained:
+            with timer.stage("predict"):
+                predictions = decoder.project(state)
+            with timer.stage("sampling"):
+                predictions[:, self._never_ids] = 0.0
+                return sample_batch(predictions, temperatures, rng)
+
+        next_token_ids = np.empty(len(positions), dtype=np.int64)
+        at_punctuation = self._punctuation_slots[positions]
+
+        chars = np.flatnonzero(~at_punctuation)
+        if chars.size:
+            with timer.stage("predict"):
+                predictions = decoder.project(_select_rows(state, chars, len(positions)))
+            with timer.stage("sampling"):
+                predictions[:, self._masked_ids] = 0.0
+                next_token_ids[chars] = sample_batch(predictions, temperatures[chars], _rows_rng(rng, chars))
+
+        punctuations = np.flatnonzero(at_punctuation)
+        if punctuations.size:
+            if self.forced_punctuation:
+                next_token_ids[punctuations] = self._forced_ids[positions[punctuations]]
+            else:
+                with timer.stage("predict"):
+                    predictions = decoder.project(_select_rows(state, punctuations, len(positions)),
+                                                  self._punctuation_ids)
+                with timer.stage("sampling"):
+                    choices = sample_batch(predictions, temperatures[punctuations], _rows_rng(rng, punctuations))
+                next_token_ids[punctuations] = self._punctuation_ids[choices]
+        return next_token_ids
+
+
+def _rows_rng(rng, rows) -> np.random.Generator | list[np.random.Generator] | None:
+    # The Generators of the given rows when there is one per row; a shared one is used as is
+    if isinstance(rng, list):
+        return [rng[i] for i in rows]
+    return rng
+
+
+def _select_rows(state: tuple, rows: np.ndarray, batch_size: int) -> tuple:
+    if len(rows) == batch_size:
+        return state
+    return tuple(s[rows] for s in state)
 
 if __name__ == "__main__":
     from config import PoemConfig
@@ -62,7 +463,7 @@ if __name__ == "__main__":
 
     poem_generator = PoemGenerator(
         genre=config.genre,
-        vectorization_model=config.vectorization_model,
+        tokenizer=config.tokenizer,
         generation_model=config.generation_model,
     )
     prompt = "春风"
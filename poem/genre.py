@@ -1,5 +1,10 @@
 from enum import unique, Enum
 
+# 诗句末尾允许出现的标点
+PUNCTUATIONS = "！，？。"
+# 多体裁模型中各体裁的条件 token：Unicode 私用区字符，不会出现在语料中
+_GENRE_TOKEN_BASE = 0xE000
+
 @unique
 class Genre(Enum):
     WUJUE = ("五言绝句", 4, 5)
@@ -16,5 +21,19 @@ class Genre(Enum):
     def length(self):
         return self.rows * (self.cols + 1)
 
+    @property
+    def punctuation_positions(self) -> list[int]:
+        """
+        每行末尾标点的固定位置
+        """
+        return [(i + 1) * (self.cols + 1) - 1 for i in range(self.rows)]
+
+    @property
+    def token(self) -> str:
+        """
+        多体裁模型中写在诗句之前的体裁 token
+        """
+        return chr(_GENRE_TOKEN_BASE + list(Genre).index(self))
+
 if __name__ == "__main__":
     print(Genre['WUJUE'])
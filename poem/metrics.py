@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# 设置 POEM_METRICS=0 关闭指标采集：计时器与计数器都换成空操作
+ENABLED = os.environ.get("POEM_METRICS", "1") != "0"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            counts = self._counts.setdefault(label_values, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[label_values] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                suffix = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{suffix} {self._sums[label_values]:g}")
+                lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the metrics and renders them in the Prometheus text format.
+
+    Collectors are callables that return extra samples `(name, type, documentation, [(labels dict, value)])`
+    at scrape time, for values that are cheaper to read than to track (cache counters, queue depth).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "poem_stage_seconds", "Time spent in each stage of PoemGenerator, per decoded batch", ("genre", "stage"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "poem_request_seconds", "End-to-end latency of generate requests", ("genre",))
+REQUESTS = REGISTRY.counter("poem_requests_total", "Generate requests received", ("genre",))
+GENERATED_TOKENS = REGISTRY.counter("poem_generated_tokens_total", "Tokens generated", ("genre",))
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in each stage over one decoded batch, then records
+    one observation per stage into STAGE_SECONDS.
+    """
+
+    def __init__(self, genre_name: str):
+        self.genre_name = genre_name
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+
+    def observe(self):
+        for name, seconds in self.totals.items():
+            STAGE_SECONDS.observe(seconds, self.genre_name, name)
+        self.totals.clear()
+
+
+class _NullStageTimer:
+    """
+    Stand-in for StageTimer when metrics are disabled: no clock reads, no locking.
+    """
+
+    class _NullContext:
+        def __enter__(self):
+            return None
+
+        def __exit__(self, *exc_info):
+            return False
+
+    _context = _NullContext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def observe(self):
+        pass
+
+
+_NULL_STAGE_TIMER = _NullStageTimer()
+
+
+def stage_timer(genre_name: str):
+    return StageTimer(genre_name) if ENABLED else _NULL_STAGE_TIMER
+
+
+def count_request(genre_name: str):
+    if ENABLED:
+        REQUESTS.inc(genre_name)
+
+
+def count_tokens(genre_name: str, amount: int):
+    if ENABLED:
+        GENERATED_TOKENS.inc(genre_name, amount=amount)
+
+
+def observe_request(genre_name: str, seconds: float):
+    if ENABLED:
+        REQUEST_SECONDS.observe(seconds, genre_name)
@@ -0,0 +1,162 @@
+import os
+
+import numpy as np
+
+# 导出文件中各权重数组的名称
+WEIGHT_NAMES = ("embedding", "lstm_kernel", "lstm_recurrent_kernel", "lstm_bias", "output_kernel", "output_bias")
+
+
+def export_weights(generation_model, path: str):
+    """
+    Export the weights of a trained `lstm_decoder` model to a plain `.npz` file.
+
+    The layers are looked up by the names given in `train/generation_model.build_model`.
+    Only the default LSTM activations (tanh / sigmoid) are supported by NumpyDecoder.
+    """
+    embedding = generation_model.get_layer("embedding")
+    lstm = generation_model.get_layer("lstm")
+    output = generation_model.get_layer("output")
+
+    lstm_config = lstm.get_config()
+    if lstm_config.get("activation") != "tanh" or lstm_config.get("recurrent_activation") != "sigmoid":
+        raise ValueError("NumpyDecoder 仅支持 activation=tanh、recurrent_activation=sigmoid 的 LSTM")
+    if not lstm_config.get("use_bias", True) or not output.get_config().get("use_bias", True):
+        raise ValueError("NumpyDecoder 要求 LSTM 与输出层均带有 bias")
+
+    lstm_kernel, lstm_recurrent_kernel, lstm_bias = lstm.get_weights()
+    output_kernel, output_bias = output.get_weights()
+    np.savez(
+        path,
+        embedding=embedding.get_weights()[0],
+        lstm_kernel=lstm_kernel,
+        lstm_recurrent_kernel=lstm_recurrent_kernel,
+        lstm_bias=lstm_bias,
+        output_kernel=output_kernel,
+        output_bias=output_bias,
+    )
+
+
+def load_arrays(path: str, names) -> dict:
+    """
+    Read the named arrays from a `.npz` file, or memory-map them read-only from a directory
+    holding one `<name>.npy` per array. Processes mapping the same directory share its pages
+    through the OS page cache, so each extra process adds little resident memory.
+    """
+    if os.path.isdir(path):
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+    with np.load(path) as arrays:
+        return {name: arrays[name] for name in names}
+
+
+def array_names(path: str) -> set[str]:
+    if os.path.isdir(path):
+        return {os.path.splitext(name)[0] for name in os.listdir(path) if name.endswith(".npy")}
+    with np.load(path) as arrays:
+        return set(arrays.files)
+
+
+def save_arrays(path: str, arrays: dict):
+    """
+    Write arrays as a `.npz` file, or as a directory of `.npy` files (memory-mappable) for
+    any other path.
+    """
+    if path.endswith(".npz"):
+        np.savez(path, **arrays)
+        return
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - np.max(logits, axis=1, keepdims=True)
+    q = np.exp(logits)
+    q /= q.sum(axis=1, keepdims=True)
+    return q
+
+
+class NumpyDecoder:
+    """
+    TensorFlow-free implementation of the Embedding -> LSTM -> Dense(softmax) decoder.
+
+    It exposes the same incremental interface as KerasStepDecoder, so PoemGenerator
+    accepts it in place of the Keras model. State is a tuple of numpy arrays `(h, c)`.
+    """
+
+    def __init__(self, embedding: np.ndarray, lstm_kernel: np.ndarray, lstm_recurrent_kernel: np.ndarray,
+                 lstm_bias: np.ndarray, output_kernel: np.ndarray, output_bias: np.ndarray):
+        self.embedding = embedding
+        self.lstm_kernel = lstm_kernel
+        self.lstm_recurrent_kernel = lstm_recurrent_kernel
+        self.lstm_bias = lstm_bias
+        self.output_kernel = output_kernel
+        self.output_bias = output_bias
+        self.units = lstm_recurrent_kernel.shape[0]
+        self.vocabulary_size = output_kernel.shape[1]
+
+    @staticmethod
+    def load(path: str) -> "NumpyDecoder":
+        """
+        Load the weights from a `.npz` file, or memory-map them from a `.npy` directory (see `load_arrays`).
+        """
+        if any(name.endswith("_scale") for name in array_names(path)):
+            raise ValueError(f"{path} 是 int8 量化权重，需用 QuantizedDecoder 加载（配置 \"quantization\": \"int8\"）")
+        return NumpyDecoder(**load_arrays(path, WEIGHT_NAMES))
+
+    def save(self, path: str):
+        save_arrays(path, {name: getattr(self, name) for name in WEIGHT_NAMES})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in WEIGHT_NAMES)
+
+    def initial_state(self, batch_size: int) -> tuple:
+        zeros = np.zeros((batch_size, self.units), dtype=np.float32)
+        return zeros, zeros.copy()
+
+    def step(self, token_ids: np.ndarray, state: tuple) -> tuple:
+        """
+        Feed token ids of shape (batch_size, steps) and return the new state.
+        """
+        token_ids = np.asarray(token_ids)
+        h, c = state
+        # Input projection for all steps at once; only the recurrent part is sequential
+        x = self._input_projection(token_ids) + self.lstm_bias
+        units = self.units
+        for t in range(token_ids.shape[1]):
+            z = x[:, t] + self._recurrent_projection(h)
+            # Gate order used by Keras: input, forget, cell, output
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units:2 * units])
+            g = np.tanh(z[:, 2 * units:3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+        return h, c
+
+    def project(self, state: tuple, candidate_ids: np.ndarray = None) -> np.ndarray:
+        """
+        Next-token probabilities of shape (batch_size, vocabulary_size) for the given state.
+
+        With `candidate_ids`, only those columns of the output layer are computed and the
+        softmax is taken over them alone: shape (batch_size, len(candidate_ids)).
+        """
+        if candidate_ids is not None:
+            return softmax(self._output_projection(state[0], candidate_ids) + self.output_bias[candidate_ids])
+        return softmax(self._output_projection(state[0]) + self.output_bias)
+
+    # The matrix products, overridden by QuantizedDecoder
+    def _input_projection(self, token_ids: np.ndarray) -> np.ndarray:
+        return self.embedding[token_ids] @ self.lstm_kernel
+
+    def _recurrent_projection(self, h: np.ndarray) -> np.ndarray:
+        return h @ self.lstm_recurrent_kernel
+
+    def _output_projection(self, h: np.ndarray, candidate_ids: np.ndarray = None) -> np.ndarray:
+        if candidate_ids is not None:
+            return h @ self.output_kernel[:, candidate_ids]
+        return h @ self.output_kernel
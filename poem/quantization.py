@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+
+from poem.numpy_decoder import NumpyDecoder, WEIGHT_NAMES, array_names, load_arrays, save_arrays
+
+# 量化为 int8 的权重，以及每个权重按哪个轴逐通道取缩放系数
+QUANTIZED_CHANNEL_AXES = {
+    "embedding": 0,  # 每个 token 一行
+    "lstm_kernel": 1,  # 每个输出单元一列
+    "lstm_recurrent_kernel": 1,
+    "output_kernel": 1,
+}
+# 矩阵乘时每次转换为 float32 的 int8 权重列数（转换缓冲区为 输入维度 x 该列数）
+DEQUANTIZE_BLOCK_COLUMNS = 256
+
+
+def quantize_per_channel(weights: np.ndarray, channel_axis: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric int8 quantization with one float32 scale per channel along `channel_axis`.
+
+    Returns (int8 weights, scales) such that `weights ≈ q * scales` broadcast along that axis.
+    """
+    reduce_axes = tuple(axis for axis in range(weights.ndim) if axis != channel_axis)
+    scales = np.abs(weights).max(axis=reduce_axes) / 127.0
+    scales[scales == 0] = 1.0
+    shape = [1] * weights.ndim
+    shape[channel_axis] = -1
+    q = np.clip(np.rint(weights / scales.reshape(shape)), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def quantize_weights(weights: dict) -> dict:
+    """
+    Quantize the float weights of a NumpyDecoder (as exported by `export_weights`); the biases stay float32.
+    """
+    quantized = {}
+    for name in WEIGHT_NAMES:
+        if name in QUANTIZED_CHANNEL_AXES:
+            quantized[name], quantized[f"{name}_scale"] = quantize_per_channel(weights[name], QUANTIZED_CHANNEL_AXES[name])
+        else:
+            quantized[name] = np.asarray(weights[name], dtype=np.float32)
+    return quantized
+
+
+class QuantizedDecoder(NumpyDecoder):
+    """
+    NumpyDecoder whose embedding, LSTM kernels and output kernel are stored as int8 with
+    per-channel scales, about a quarter of the float32 size.
+
+    NumPy has no fast int8 matrix product (integer matmul does not use BLAS), so each
+    product converts `DEQUANTIZE_BLOCK_COLUMNS` columns of the int8 kernel at a time into
+    a reused float32 buffer and multiplies block by block; the per-channel scales are applied
+    to the result. No full float32 copy of a kernel is ever made, so the gain is memory:
+    decoding is slower than with the float32 NumpyDecoder, most of all at small batch sizes.
+    """
+
+    def __init__(self, embedding: np.ndarray, embedding_scale: np.ndarray,
+                 lstm_kernel: np.ndarray, lstm_kernel_scale: np.ndarray,
+                 lstm_recurrent_kernel: np.ndarray, lstm_recurrent_kernel_scale: np.ndarray, lstm_bias: np.ndarray,
+                 output_kernel: np.ndarray, output_kernel_scale: np.ndarray, output_bias: np.ndarray):
+        super().__init__(embedding, lstm_kernel, lstm_recurrent_kernel, lstm_bias, output_kernel, output_bias)
+        self.embedding_scale = embedding_scale
+        self.lstm_kernel_scale = lstm_kernel_scale
+        self.lstm_recurrent_kernel_scale = lstm_recurrent_kernel_scale
+        self.output_kernel_scale = output_kernel_scale
+        # One conversion buffer per thread: a shared multi-genre decoder is stepped from several threads
+        self._buffers = threading.local()
+
+    @staticmethod
+    def load(path: str) -> "QuantizedDecoder":
+        """
+        Load a `.npz` file or `.npy` directory written by `QuantizedDecoder.save`, or quantize the
+        float weights of one written by `export_weights` on the fly.
+        """
+        if not is_quantized(path):
+            return QuantizedDecoder(**quantize_weights(load_arrays(path, WEIGHT_NAMES)))
+        names = list(WEIGHT_NAMES) + [f"{name}_scale" for name in QUANTIZED_CHANNEL_AXES]
+        return QuantizedDecoder(**load_arrays(path, names))
+
+    def save(self, path: str):
+        save_arrays(path, {**{name: getattr(self, name) for name in WEIGHT_NAMES},
+                           **{f"{name}_scale": getattr(self, f"{name}_scale") for name in QUANTIZED_CHANNEL_AXES}})
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + sum(getattr(self, f"{name}_scale").nbytes for name in QUANTIZED_CHANNEL_AXES)
+
+    def _input_projection(self, token_ids: np.ndarray) -> np.ndarray:
+        x = self.embedding[token_ids] * self.embedding_scale[token_ids][..., None]
+        return self._matmul(x, self.lstm_kernel, self.lstm_kernel_scale)
+
+    def _recurrent_projection(self, h: np.ndarray) -> np.ndarray:
+        return self._matmul(h, self.lstm_recurrent_kernel, self.lstm_recurrent_kernel_scale)
+
+    def _output_projection(self, h: np.ndarray, candidate_ids: np.ndarray = None) -> np.ndarray:
+        if candidate_ids is not None:
+            # Few columns (e.g. the punctuation): convert them directly
+            return (h @ self.output_kernel[:, candidate_ids].astype(np.float32)) * self.output_kernel_scale[candidate_ids]
+        return self._matmul(h, self.output_kernel, self.output_kernel_scale)
+
+    def _matmul(self, x: np.ndarray, kernel: np.ndarray, scale: np.ndarray) -> np.ndarray:
+        """
+        `x @ (kernel * scale)` for an int8 kernel, converting it block by block into the thread's buffer.
+        """
+        x2 = np.ascontiguousarray(x.reshape(-1, x.shape[-1]), dtype=np.float32)
+        rows, columns = kernel.shape
+        buffer = getattr(self._buffers, "float32", None)
+        if buffer is None or buffer.shape[0] < rows:
+            buffer = np.empty((max(rows, self.units), DEQUANTIZE_BLOCK_COLUMNS), dtype=np.float32)
+            self._buffers.float32 = buffer
+        out = np.empty((len(x2), columns), dtype=np.float32)
+        for start in range(0, columns, DEQUANTIZE_BLOCK_COLUMNS):
+            stop = min(start + DEQUANTIZE_BLOCK_COLUMNS, columns)
+            block = buffer[:rows, :stop - start]
+            np.copyto(block, kernel[:, start:stop], casting="unsafe")
+            np.matmul(x2, block, out=out[:, start:stop])
+        out *= scale
+        return out.reshape(*x.shape[:-1], columns)
+
+
+def is_quantized(path: str) -> bool:
+    """
+    Whether the `.npz` file or `.npy` directory holds int8 weights with their scales (`QuantizedDecoder.save`).
+    """
+    return any(name.endswith("_scale") for name in array_names(path))
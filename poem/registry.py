@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from poem.config import PoemConfig
+
+
+class ModelRegistry:
+    """
+    Lazily loads one object per genre entry of poem_config.json on first use.
+
+    `factory` turns a loaded PoemConfig into the object that is kept resident
+    (e.g. a PoemGenerator behind a BatchScheduler). At most `max_resident`
+    objects stay loaded; the least recently used one is evicted, and closed if
+    it has a `close()` method. `max_resident=0` means no limit.
+
+    Loading is thread-safe: concurrent first requests for the same genre wait
+    for a single load instead of loading the model twice. `load_seconds` holds the
+    time the last load of each genre took to read its vocabulary and model, before
+    `factory` runs.
+    """
+
+    def __init__(self, config_dicts: list[dict], factory: Callable[[PoemConfig], object] = None,
+                 max_resident: int = 0):
+        if max_resident < 0:
+            raise ValueError("max_resident 必须为非负整数")
+        self.config_dicts = {cfg['genre']: cfg for cfg in config_dicts}
+        self.factory = factory or (lambda config: config)
+        self.max_resident = max_resident
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.load_seconds = {}
+
+    def __contains__(self, genre_name: str) -> bool:
+        return genre_name in self.config_dicts
+
+    def resident(self) -> list[str]:
+        with self._lock:
+            return list(self._resident)
+
+    def resident_items(self) -> list[tuple[str, object]]:
+        """
+        The loaded (genre name, object) pairs, without marking them as used.
+        """
+        with self._lock:
+            return list(self._resident.items())
+
+    def get(self, genre_name: str):
+        if genre_name not in self.config_dicts:
+            raise KeyError(f"未配置体裁：{genre_name}")
+
+        with self._lock:
+            if genre_name in self._resident:
+                self._resident.move_to_end(genre_name)
+                return self._resident[genre_name]
+            load_lock = self._load_locks.setdefault(genre_name, threading.Lock())
+
+        # Load outside the registry lock, so other genres stay available meanwhile
+        with load_lock:
+            with self._lock:
+                if genre_name in self._resident:
+                    self._resident.move_to_end(genre_name)
+                    return self._resident[genre_name]
+            start = time.perf_counter()
+            config = PoemConfig.from_config(self.config_dicts[genre_name])
+            self.load_seconds[genre_name] = time.perf_counter() - start
+            loaded = self.factory(config)
+            with self._lock:
+                self._resident[genre_name] = loaded
+                evicted = []
+                while self.max_resident and len(self._resident) > self.max_resident:
+                    evicted.append(self._resident.popitem(last=False)[1])
+
+        for item in evicted:
+            if hasattr(item, "close"):
+                item.close()
+        return loaded
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+import weakref
+from typing import Iterator
+
+from poem.batching import BatchScheduler, SchedulerClosed
+from poem.cache import LRUCache, sizeof_poems, sizeof_state
+from poem.config import PoemConfig
+from poem.generator import PoemGenerator
+from poem.registry import ModelRegistry
+
+# 微批处理：在时间窗口内（或攒满 max batch size 后）把并发请求合并为一个 batch 解码
+BATCH_WINDOW_MS = float(os.environ.get("POEM_BATCH_WINDOW_MS", "10"))
+MAX_BATCH_SIZE = int(os.environ.get("POEM_MAX_BATCH_SIZE", "8"))
+# 结构约束解码：标点位置只在标点中采样，其余位置屏蔽标点，保证输出格式工整
+CONSTRAINED_DECODING = os.environ.get("POEM_CONSTRAINED_DECODING", "1") != "0"
+# 在约束解码的基础上，行末直接按“，”“。”交替填入标点，不再计算输出层
+FORCED_PUNCTUATION = os.environ.get("POEM_FORCED_PUNCTUATION", "0") != "0"
+# 同时驻留内存的体裁模型数量上限（0 表示不限制），超出时淘汰最久未使用的模型
+MAX_RESIDENT_MODELS = int(os.environ.get("POEM_MAX_RESIDENT_MODELS", "0"))
+# 缓存容量（MB，0 表示关闭）：确定性请求（温度 0、指定随机种子、束搜索）的结果缓存，以及热门提示词编码后的 LSTM 状态缓存
+RESULT_CACHE_MB = float(os.environ.get("POEM_RESULT_CACHE_MB", "16"))
+PREFIX_CACHE_MB = float(os.environ.get("POEM_PREFIX_CACHE_MB", "64"))
+# 预热：启动时加载各体裁模型并生成几首诗（完成计算图追踪等首次开销），完成后才报告就绪。
+# 1 表示全部已配置的体裁，也可只列出部分体裁（如 WUJUE,QILV），均不超过 POEM_MAX_RESIDENT_MODELS；
+# 其余体裁在首次请求时才加载（不预热）。设为 0 关闭，全部按需加载
+_WARMUP_SETTING = os.environ.get("POEM_WARMUP", "1").strip()
+WARMUP = _WARMUP_SETTING != "0"
+# None 表示全部已配置的体裁
+WARMUP_GENRES = (None if _WARMUP_SETTING in ("0", "1")
+                 else [name.strip().upper() for name in _WARMUP_SETTING.split(",") if name.strip()])
+
+
+class Serving:
+    """
+    按上面的环境变量配置的生成服务：每个体裁一个 BatchScheduler，按需加载（ModelRegistry），
+    各体裁共用结果缓存与前缀缓存（缓存键中包含体裁）。
+
+    app.py 在进程内直接使用；多进程模式下每个工作进程各有一份（见 poem/worker_pool.py）。
+    """
+
+    def __init__(self, config_dicts: list[dict]):
+        self.result_cache = LRUCache(int(RESULT_CACHE_MB * 2 ** 20), sizeof=sizeof_poems) if RESULT_CACHE_MB > 0 else None
+        self.prefix_cache = LRUCache(int(PREFIX_CACHE_MB * 2 ** 20), sizeof=sizeof_state) if PREFIX_CACHE_MB > 0 else None
+        self.generators = ModelRegistry(config_dicts, factory=self.load_generator, max_resident=MAX_RESIDENT_MODELS)
+        # 新加载、尚未服务过真实请求的 BatchScheduler：其首个请求的延迟会输出到日志；
+        # 以及启动时预热过的 BatchScheduler（均为弱引用，不妨碍淘汰后释放）
+        self._first_requests = weakref.WeakSet()
+        self._warmed = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def load_generator(self, cfg: PoemConfig) -> BatchScheduler:
+        # 一致性校验：每个体裁的模型输出维度应等于其词表大小
+        cfg.check()
+        scheduler = BatchScheduler(
+            PoemGenerator(
+                genre=cfg.genre,
+                tokenizer=cfg.tokenizer,
+                generation_model=cfg.generation_model,
+                constrained=CONSTRAINED_DECODING,
+                forced_punctuation=FORCED_PUNCTUATION,
+                prefix_cache=self.prefix_cache,
+            ),
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=BATCH_WINDOW_MS,
+            result_cache=self.result_cache,
+        )
+        # 预热只在启动时进行（见 warm_up），请求路径上的按需加载不生成试生成的诗
+        with self._lock:
+            self._first_requests.add(scheduler)
+        return scheduler
+
+    def stream(self, genre_name: str, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+               decoding: str = "sample", beam_width: int = 4) -> Iterator[str]:
+        """
+        逐步产出格式化后的部分结果，最后一项为完整结果（见 BatchScheduler.stream）
+        """
+        while True:
+            scheduler = self.generators.get(genre_name)
+            start = time.perf_counter()
+            try:
+                partials = scheduler.stream(prompt, temperature, num_samples=num_samples, seed=seed,
+                                            decoding=decoding, beam_width=beam_width)
+            except SchedulerClosed:
+                # 取到生成器后恰好被 LRU 淘汰，重新加载即可
+                continue
+            with self._lock:
+                first = scheduler in self._first_requests
+                self._first_requests.discard(scheduler)
+                warmed = scheduler in self._warmed
+            return self._log_first_request(genre_name, partials, start, warmed) if first else partials
+
+    def _log_first_request(self, genre_name: str, partials: Iterator[str], start: float,
+                           warmed: bool) -> Iterator[str]:
+        yield from partials
+        print(f"[INFO] First request {genre_name}: {(time.perf_counter() - start) * 1000:.0f} ms "
+              f"({'after warm-up' if warmed else 'no warm-up'})", flush=True)
+
+    def warm_up(self):
+        """
+        启动时加载并预热 POEM_WARMUP 指定的体裁（默认全部已配置的体裁，不超过驻留上限），
+        由 app.py 的启动线程与各工作进程在报告就绪前调用；POEM_WARMUP=0 时什么也不做
+        """
+        if not WARMUP:
+            return
+        genre_names = list(self.generators.config_dicts) if WARMUP_GENRES is None else WARMUP_GENRES
+        unknown = [name for name in genre_names if name not in self.generators]
+        if unknown:
+            print(f"[WARN] POEM_WARMUP 中的体裁未配置，跳过：{', '.join(unknown)}", flush=True)
+        genre_names = [name for name in genre_names if name in self.generators]
+        for genre_name in genre_names[:MAX_RESIDENT_MODELS or None]:
+            scheduler = self.generators.get(genre_name)
+            cold, warm = scheduler.generator.warm_up(MAX_BATCH_SIZE)
+            print(f"[INFO] Warm-up {genre_name}: load {self.generators.load_seconds.get(genre_name, 0.0):.2f}s, "
+                  f"warm-up poem {cold * 1000:.0f} ms cold / {warm * 1000:.0f} ms warm", flush=True)
+            with self._lock:
+                self._warmed.add(scheduler)
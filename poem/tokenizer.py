@@ -0,0 +1,122 @@
+import os
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+
+# 与 keras TextVectorization 的约定保持一致：0 为填充，1 为未登录字
+PADDING_TOKEN = ""
+OOV_TOKEN = "[UNK]"
+PADDING_ID = 0
+OOV_ID = 1
+
+
+def count_characters(texts: Iterable[str]) -> Counter:
+    counts = Counter()
+    for text in texts:
+        counts.update(text)
+    return counts
+
+
+class Tokenizer:
+    """
+    Character-level tokenizer shared by training and serving.
+
+    It keeps the id layout of the keras `TextVectorization(split='character')` vocabularies
+    saved in `models/*_vocabulary.txt` (padding at 0, `[UNK]` at 1), with a precomputed
+    char -> id dict and id -> char list for O(1) lookups per character.
+    """
+
+    def __init__(self, vocabulary: Iterable[str]):
+        self._vocabulary = [str(token) for token in vocabulary]
+        if self._vocabulary[:2] != [PADDING_TOKEN, OOV_TOKEN]:
+            raise ValueError(f"词表的前两项必须为填充符与 {OOV_TOKEN}")
+        self._token_to_id = {token: i for i, token in enumerate(self._vocabulary)}
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._vocabulary)
+
+    def get_vocabulary(self) -> list[str]:
+        return list(self._vocabulary)
+
+    def encode(self, text: str) -> list[int]:
+        token_to_id = self._token_to_id
+        return [token_to_id.get(ch, OOV_ID) for ch in text]
+
+    def encode_batch(self, texts: Iterable[str], length: int, dtype=np.int32) -> np.ndarray:
+        """
+        Encode texts into a (len(texts), length) matrix, truncated or padded with PADDING_ID.
+        """
+        texts = list(texts)
+        token_ids = np.full((len(texts), length), PADDING_ID, dtype=dtype)
+        for row, text in zip(token_ids, texts):
+            ids = self.encode(text[:length])
+            row[:len(ids)] = ids
+        return token_ids
+
+    def decode(self, token_ids: Iterable[int]) -> str:
+        vocabulary = self._vocabulary
+        return ''.join(vocabulary[token_id] for token_id in token_ids)
+
+    @staticmethod
+    def from_texts(texts: Iterable[str], max_tokens: int = 0, min_count: int = 1) -> "Tokenizer":
+        """
+        Build a vocabulary from the characters of texts, most frequent first.
+        See `from_counts` for the pruning options.
+        """
+        return Tokenizer.from_counts(count_characters(texts), max_tokens, min_count)
+
+    @staticmethod
+    def from_counts(counts: Counter, max_tokens: int = 0, min_count: int = 1,
+                    reserved_tokens: Iterable[str] = ()) -> "Tokenizer":
+        """
+        Build a vocabulary from character counts, most frequent first.
+
+        :param max_tokens: int, the maximum vocabulary size including padding and [UNK] (0: no limit)
+        :param min_count: int, characters seen fewer times are left out
+        :param reserved_tokens: tokens kept whatever their count (e.g. the genre tokens)
+        Left out characters are encoded as [UNK].
+        """
+        reserved_tokens = set(reserved_tokens)
+        budget = max_tokens - 2 - len(reserved_tokens & counts.keys()) if max_tokens else None
+        if budget is not None and budget < 1:
+            raise ValueError("max_tokens 过小：至少要容纳填充符、[UNK]、保留 token 与一个字")
+        tokens = []
+        for token, count in counts.most_common():
+            if token in (PADDING_TOKEN, OOV_TOKEN):
+                continue
+            if token not in reserved_tokens:
+                if count < min_count or budget == 0:
+                    continue
+                if budget is not None:
+                    budget -= 1
+            tokens.append(token)
+        return Tokenizer([PADDING_TOKEN, OOV_TOKEN] + tokens)
+
+    @staticmethod
+    def load(path: str) -> "Tokenizer":
+        """
+        Load a vocabulary saved as text (one token per line) or as a `.npy` array (memory-mapped).
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"未找到词表：{path}")
+        if path.endswith(".npy"):
+            vocabulary = np.load(path, mmap_mode="r").tolist()
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                vocabulary = [line.rstrip("\n") for line in f]
+        if not vocabulary:
+            raise ValueError("词表为空")
+        return Tokenizer(vocabulary)
+
+    def save(self, path: str):
+        """
+        Save the vocabulary as text, or as a compact fixed-width `.npy` array if path ends with `.npy`.
+        """
+        if path.endswith(".npy"):
+            np.save(path, np.array(self._vocabulary, dtype=str))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                for token in self._vocabulary:
+                    f.write(f"{token}\n")
@@ -0,0 +1,286 @@
+import itertools
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Iterator
+
+# 工作进程连接前端时使用的认证密钥（十六进制），由 WorkerPool 通过环境变量传给子进程
+_AUTHKEY_ENV = "POEM_WORKER_AUTHKEY"
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class _Worker:
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.connection: Connection = None
+        self.in_flight = set()
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+
+class WorkerPool:
+    """
+    Serves generate requests from `num_workers` worker processes, each running its own
+    `Serving` (PoemGenerators behind BatchSchedulers) for the genres of `config_path`.
+
+    Each worker handles up to `concurrency` requests at a time, so concurrent requests
+    still share micro-batches inside a worker; further requests wait here and go to
+    the least busy worker as soon as one frees up. The partial poems are streamed back
+    over a `multiprocessing.connection` per worker.
+
+    Workers are started as fresh interpreters (`python -m poem.worker_pool`) rather than
+    forked, so they inherit neither the threads nor the Gradio state of the front end.
+    They read the same POEM_* environment variables as in-process serving. With weights
+    saved as `.npy` directories (export_weights.py --mmap), all workers map the same
+    pages and each extra worker costs little memory.
+    """
+
+    def __init__(self, config_path: str, num_workers: int, concurrency: int = 8, start_timeout: float = 600.0):
+        if num_workers < 1:
+            raise ValueError("num_workers 必须为正整数")
+        if concurrency < 1:
+            raise ValueError("concurrency 必须为正整数")
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._streams = {}
+        self._request_ids = itertools.count()
+        self._closed = False
+
+        authkey = os.urandom(32)
+        self._listener = Listener(authkey=authkey)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, **{_AUTHKEY_ENV: authkey.hex()})
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "poem.worker_pool", str(self._listener.address),
+                   os.path.abspath(config_path), str(concurrency)]
+        self.workers = [_Worker(subprocess.Popen(command, env=env)) for _ in range(num_workers)]
+        try:
+            self._connect(start_timeout)
+        except BaseException:
+            # 启动失败：不等待仍在加载的工作进程，直接结束
+            self.close(timeout=0)
+            raise
+
+        for worker in self.workers:
+            threading.Thread(target=self._read, args=(worker,), name=f"worker-{worker.process.pid}",
+                             daemon=True).start()
+
+    def _connect(self, timeout: float):
+        """
+        Accept one connection per worker and wait until each has loaded its models.
+        """
+        accepted = queue.Queue()
+
+        def accept():
+            for _ in self.workers:
+                try:
+                    accepted.put(self._listener.accept())
+                except OSError:
+                    return
+
+        threading.Thread(target=accept, daemon=True).start()
+        by_pid = {worker.process.pid: worker for worker in self.workers}
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while ready < len(self.workers):
+            try:
+                connection = accepted.get(timeout=1.0)
+            except queue.Empty:
+                if any(worker.process.poll() is not None for worker in self.workers):
+                    raise WorkerError("工作进程启动失败")
+                if time.monotonic() >= deadline:
+                    raise WorkerError("等待工作进程启动超时")
+                continue
+            # 已连接的工作进程仍在加载模型：同样受 start_timeout 限制，并及时发现它异常退出
+            while not connection.poll(1.0):
+                if any(worker.process.poll() is not None for worker in self.workers):
+                    raise WorkerError("工作进程启动失败")
+                if time.monotonic() >= deadline:
+                    raise WorkerError("等待工作进程启动超时")
+            kind, pid, message = connection.recv()
+            if kind != "ready":
+                raise WorkerError(f"工作进程加载失败：{message}")
+            by_pid[pid].connection = connection
+            ready += 1
+
+    def stream(self, genre_name: str, prompt: str, temperature: float = 1.0, num_samples: int = 1, seed=None,
+               decoding: str = "sample", beam_width: int = 4) -> Iterator[str]:
+        """
+        Same as `Serving.stream`, served by one of the workers.
+        """
+        partials = queue.Queue()
+        with self._lock:
+            if self._closed:
+                raise WorkerError("WorkerPool 已关闭")
+            request_id = next(self._request_ids)
+            self._streams[request_id] = partials
+            self._pending.append((request_id, genre_name, dict(
+                prompt=prompt, temperature=temperature, num_samples=num_samples, seed=seed,
+                decoding=decoding, beam_width=beam_width)))
+            self._dispatch()
+
+        def iterate():
+            while True:
+                kind, payload = partials.get()
+                if kind == "partial":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise WorkerError(payload)
+        return iterate()
+
+    def generate_and_format(self, genre_name: str, prompt: str, temperature: float = 1.0, num_samples: int = 1,
+                            seed=None, decoding: str = "sample", beam_width: int = 4) -> str:
+        result = None
+        for result in self.stream(genre_name, prompt, temperature, num_samples, seed, decoding, beam_width):
+            pass
+        return result
+
+    def queue_depth(self) -> int:
+        """
+        Number of requests waiting for a free worker slot.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(len(worker.in_flight) for worker in self.workers)
+
+    def _dispatch(self):
+        # Called with self._lock held
+        while self._pending:
+            live = [worker for worker in self.workers if worker.connection is not None]
+            if not live:
+                while self._pending:
+                    self._streams.pop(self._pending.popleft()[0]).put(("error", "没有可用的工作进程"))
+                return
+            worker = min(live, key=lambda w: len(w.in_flight))
+            if len(worker.in_flight) >= self.concurrency:
+                return
+            request = self._pending.popleft()
+            try:
+                worker.send(request)
+            except OSError:
+                # 连接已断开：不再向该进程派发，请求放回队首交给其他工作进程（_read 随后清理它的其余请求）
+                worker.connection = None
+                self._pending.appendleft(request)
+                continue
+            worker.in_flight.add(request[0])
+
+    def _read(self, worker: _Worker):
+        # _dispatch 发送失败时会把 worker.connection 置空，这里继续读原连接直到它关闭
+        connection = worker.connection
+        while True:
+            try:
+                kind, request_id, payload = connection.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                partials = self._streams.get(request_id)
+                if kind != "partial":
+                    self._streams.pop(request_id, None)
+                    worker.in_flight.discard(request_id)
+                    self._dispatch()
+            if partials is not None:
+                partials.put((kind, payload))
+
+        # The worker is gone: fail its requests and stop sending it new ones
+        with self._lock:
+            worker.connection = None
+            lost = [self._streams.pop(request_id) for request_id in worker.in_flight if request_id in self._streams]
+            worker.in_flight.clear()
+            self._dispatch()
+        for partials in lost:
+            partials.put(("error", "工作进程已退出"))
+
+    def close(self, timeout: float = 10.0):
+        """
+        Stop the workers; requests they are still serving are finished first.
+        """
+        with self._lock:
+            self._closed = True
+        for worker in self.workers:
+            if worker.connection is not None:
+                try:
+                    worker.send(None)
+                except OSError:
+                    pass
+        for worker in self.workers:
+            try:
+                worker.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()
+        self._listener.close()
+
+
+# -------- 工作进程 --------
+def _serve(connection: Connection, serving, concurrency: int):
+    requests = queue.Queue()
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    def handle():
+        while (request := requests.get()) is not None:
+            request_id, genre_name, kwargs = request
+            try:
+                for partial in serving.stream(genre_name, **kwargs):
+                    send(("partial", request_id, partial))
+            except Exception as e:
+                send(("error", request_id, f"{type(e).__name__}: {e}"))
+            else:
+                send(("done", request_id, None))
+
+    threads = [threading.Thread(target=handle, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            request = None
+        if request is None:
+            break
+        requests.put(request)
+    for _ in threads:
+        requests.put(None)
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    address, config_path, concurrency = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    connection = Client(address, authkey=bytes.fromhex(os.environ.pop(_AUTHKEY_ENV)))
+    try:
+        from poem.config import read_config_dicts
+        from poem.serving import Serving
+
+        serving = Serving(read_config_dicts(config_path))
+        # 报告就绪前加载并预热 POEM_WARMUP 指定的体裁（见 Serving.warm_up），其余按需加载
+        serving.warm_up()
+    except Exception as e:
+        connection.send(("failed", os.getpid(), f"{type(e).__name__}: {e}"))
+        raise
+    connection.send(("ready", os.getpid(), None))
+    _serve(connection, serving, concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Poetry LSTM hyperparameter sweep
+
+- Read, clean and encode the corpus once (through the corpus and token caches)
+- Train a grid (or a random subset) of LSTM units / embedding / batch size / dropout settings,
+  `--parallel` trials at a time, each in its own process limited to `--threads-per-trial` threads
+  and memory-mapping the same token matrix
+- Hold out a fixed `--validation-fraction` of the poems and evaluate every trial on it after each
+  epoch (full-softmax loss, also with --softmax sampled)
+- Stop a trial early once, after `--min-epochs`, its best validation loss is more than
+  `--stop-margin` worse than the median of the other trials at the same epoch
+- Save each trial's model and append its row (model path, wall time, steps/sec, validation loss)
+  to results.csv in the output directory
+
+Run:
+  python sweep.py -g WUJUE -e 10 --lstm-units 256 512 --dropout-rate 0.1 0.3 --parallel 2
+  python sweep.py --multi-genre --search random --trials 8 --lstm-units 256 512 1024 --batch-size 128 256
+"""
+
+import argparse
+import os
+import time
+from dataclasses import fields
+
+from train.config import Config
+from train.parse_args import add_model_arguments, add_training_arguments, check_training_arguments
+from train.sweep import SWEEP_PARAMETERS, MedianStoppingRule, run_sweep, sweep_trials
+from train.vectorization_model import MULTI_GENRE_NAME
+
+
+def main():
+    parser = argparse.ArgumentParser(description="诗歌 LSTM 超参数搜索：语料只编码一次，多个试验并行训练")
+    add_training_arguments(parser, epochs=10)
+    # 搜索空间：每个参数可给多个取值
+    add_model_arguments(parser, multiple=True)
+    parser.add_argument("--search", choices=["grid", "random"], default="grid",
+                        help="grid 尝试全部组合；random 随机抽取 --trials 个组合（默认 grid）")
+    parser.add_argument("--trials", type=int, default=0,
+                        help="random 搜索的试验数（默认 0 表示全部组合）")
+    parser.add_argument("--seed", type=int, default=0, help="random 搜索的随机种子（默认 0）")
+
+    # 并行与提前终止
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="同时训练的试验数（默认 1）")
+    parser.add_argument("--threads-per-trial", type=int, default=0,
+                        help="每个试验可用的线程数（默认 0 表示 CPU 核数 / --parallel）")
+    parser.add_argument("--validation-fraction", type=float, default=0.1,
+                        help="留作验证集的诗的比例（默认 0.1）")
+    parser.add_argument("--min-epochs", type=int, default=2,
+                        help="至少训练这么多轮后才可能提前终止（默认 2）")
+    parser.add_argument("--stop-margin", type=float, default=0.1,
+                        help="验证损失比其他试验同一轮的中位数差多少（相对值）时提前终止（默认 0.1，负数表示不终止）")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="模型与结果表的目录（默认 sweeps/<体裁>-<时间>）")
+
+    args = parser.parse_args()
+    check_training_arguments(parser, args)
+    for option, value in (("--trials", args.trials), ("--threads-per-trial", args.threads_per_trial)):
+        if value < 0:
+            parser.error(f"{option} 不能为负数：{value}")
+    for option, value in (("--parallel", args.parallel), ("--min-epochs", args.min_epochs)):
+        if value <= 0:
+            parser.error(f"{option} 必须为正整数：{value}")
+    if not 0.0 < args.validation_fraction < 1.0:
+        parser.error(f"--validation-fraction 取值 (0,1)：{args.validation_fraction}")
+
+    base_config = Config(**{name: value for name, value in vars(args).items()
+                            if name in {f.name for f in fields(Config)} and name not in SWEEP_PARAMETERS})
+    grid = {name: getattr(args, name) for name in SWEEP_PARAMETERS}
+    trials = sweep_trials(grid, args.search, args.trials, args.seed)
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // args.parallel)
+    name = MULTI_GENRE_NAME if args.multi_genre else args.genre.name
+    output_dir = args.output_dir or os.path.join("sweeps", f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    print(f"[INFO] {len(trials)} trials, {args.parallel} at a time with {threads} threads each -> {output_dir}")
+
+    stopping = MedianStoppingRule(os.path.join(output_dir, "history"), args.min_epochs, margin=args.stop_margin)
+    results = run_sweep(base_config, trials, output_dir, args.parallel, threads, args.validation_fraction, stopping)
+
+    print(f"{'trial':>5} {'units':>6} {'embed':>6} {'batch':>6} {'dropout':>8} {'status':>10} "
+          f"{'epochs':>6} {'val_loss':>9} {'steps/s':>8} {'wall (s)':>9}")
+    for r in results:
+        print(f"{r['trial']:>5} {r['lstm_units']:>6} {r['embedding_dim']:>6} {r['batch_size']:>6} "
+              f"{r['dropout_rate']:>8} {r['status']:>10} {r.get('epochs', 0):>6} "
+              f"{r.get('val_loss', float('nan')):>9.4f} {r.get('steps_per_sec', 0.0):>8.1f} "
+              f"{r.get('wall_seconds', 0.0):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ Poetry LSTM Train Pipeline
 This script reproduces the end-to-end workflow:
 - Load dataset files
 - Clean & validate poem texts by genre rules
-- Build TextVectorization and save its vocabulary
+- Build the character Tokenizer and save its vocabulary
 - Build, train, and save an LSTM decoder model
 - Generate a sample poem using the trained model
 
@@ -17,19 +17,18 @@ Requirements:
 
 Run:
   python train.py -g WUJUE
+  python train.py --multi-genre
 """
 
 from train.parse_args import get_config_from_cli
-from train.read_dataset import read_poem_text
-from train.vectorization_model import convert_to_tokens
+from train.vectorization_model import prepare_training_tokens
 from train.generation_model import train_model
 
 
 def main():
     config = get_config_from_cli()
-    train_poem = read_poem_text(config)
-    train_sequences, target_sequences, text_vectorization = convert_to_tokens(train_poem, config.genre)
-    train_model(train_sequences, target_sequences, text_vectorization, config)
+    train_sequences, target_sequences, tokenizer = prepare_training_tokens(config)
+    train_model(train_sequences, target_sequences, tokenizer, config)
 
 
 if __name__ == "__main__":
@@ -5,10 +5,25 @@ from poem.genre import Genre
 
 @dataclass
 class Config:
-    genre: Genre
+    # None with multi_genre: one model is trained for all genres
+    genre: Genre | None
     batch_size: int = 256
     epochs: int = 50
     embedding_dim: int = 100
     lstm_units: int = 512
     dropout_rate: float = 0.1
     dataset_number: int = 0
+    num_workers: int = 0
+    corpus_cache: bool = True
+    input_pipeline: str = "pydataset"
+    shuffle_buffer: int = 10000
+    multi_genre: bool = False
+    # Vocabulary pruning, rarer characters become [UNK]: 0 means no size limit
+    max_tokens: int = 0
+    min_count: int = 1
+    # "full" softmax, or "sampled" softmax over num_sampled negative classes (training only)
+    softmax: str = "full"
+    num_sampled: int = 512
+    # Repeated poems after the checks: "none", "exact" or "near" (also near duplicates, see read_dataset)
+    dedup: str = "exact"
+    near_duplicate_threshold: float = 0.8
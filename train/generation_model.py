@@ -1,10 +1,35 @@
+import math
 import os
+import time
 
 import keras
+import numpy as np
+import tensorflow as tf
 from keras import layers, models
 
 from poem.generator import PoemGenerator
+from poem.genre import Genre
+from poem.tokenizer import PADDING_ID, Tokenizer
 from train.config import Config
+from train.vectorization_model import MULTI_GENRE_NAME
+
+# Rows of the training set the final perplexity is measured on
+PERPLEXITY_SAMPLE_ROWS = 4096
+
+
+def gather_batch(train_sequences: np.ndarray, target_sequences: np.ndarray, rows: np.ndarray,
+                 mask_padding: bool = False) -> tuple:
+    """
+    Copy the given rows out of the token matrices as (inputs, targets), plus per-token sample
+    weights that exclude padding targets with `mask_padding`.
+    """
+    # Sorted rows read a memory-mapped file front to back; order within a batch does not matter
+    rows = np.sort(rows)
+    inputs = train_sequences[rows].astype(np.int32)
+    targets = target_sequences[rows].astype(np.int32)
+    if not mask_padding:
+        return inputs, targets
+    return inputs, targets, (targets != PADDING_ID).astype(np.float32)
 
 
 def build_model(config: Config, vocab_size: int) -> keras.Model:
@@ -16,38 +41,209 @@ def build_model(config: Config, vocab_size: int) -> keras.Model:
     return models.Model(inputs=inputs, outputs=outputs, name="lstm_decoder")
 
 
-def train_model(train_sequences, target_sequences, text_vectorization: layers.TextVectorization, config: Config):
-    vocab_list = text_vectorization.get_vocabulary()
-    genre = config.genre
+class SampledSoftmaxTrainer(keras.Model):
+    """
+    Trains an `lstm_decoder` model with a sampled softmax instead of the full one.
 
-    # --- Build model (simple LSTM decoder) ---
-    model = build_model(config, len(vocab_list))
-    model.summary()
+    At each step the loss only scores the target token against `num_sampled` negative classes,
+    drawn by `tf.nn.sampled_softmax_loss` from a log-uniform (Zipfian) distribution over the
+    class ids. The vocabularies are sorted most frequent first, which is what that sampler assumes.
 
-    # --- Train model ---
+    The trainer shares the layers of `decoder`: after fitting, the plain decoder (full softmax)
+    is what gets saved and served, so PoemGenerator is unchanged.
+    """
+
+    def __init__(self, decoder: keras.Model, num_sampled: int, **kwargs):
+        super().__init__(name="sampled_softmax_trainer", **kwargs)
+        self.decoder = decoder
+        self.hidden = keras.Model(decoder.input, decoder.get_layer("dropout").output, name="lstm_hidden")
+        self.output_layer = decoder.get_layer("output")
+        self.num_sampled = num_sampled
+
+    def call(self, inputs, training=False):
+        # The hidden states; the loss applies the output layer to the sampled classes only
+        return self.hidden(inputs, training=training)
+
+    def compute_loss(self, x=None, y=None, y_pred=None, sample_weight=None, training=True):
+        units = self.output_layer.kernel.shape[0]
+        losses = tf.nn.sampled_softmax_loss(
+            weights=tf.transpose(self.output_layer.kernel),
+            biases=self.output_layer.bias,
+            labels=tf.reshape(tf.cast(y, tf.int64), (-1, 1)),
+            inputs=tf.reshape(y_pred, (-1, units)),
+            num_sampled=self.num_sampled,
+            num_classes=self.output_layer.units,
+        )
+        if sample_weight is None:
+            return tf.reduce_mean(losses)
+        weights = tf.reshape(tf.cast(sample_weight, losses.dtype), (-1,))
+        return tf.reduce_sum(losses * weights) / tf.maximum(tf.reduce_sum(weights), 1.0)
+
+
+def compile_for_training(model: keras.Model, config: Config) -> keras.Model:
+    """
+    The model to fit: `model` itself with the full softmax loss, or a SampledSoftmaxTrainer
+    sharing its layers with `config.softmax == "sampled"`.
+    """
+    if config.softmax == "sampled":
+        vocab_size = model.get_layer("output").units
+        if config.num_sampled < vocab_size:
+            trainer = SampledSoftmaxTrainer(model, config.num_sampled)
+            trainer.compile(optimizer="adam")
+            return trainer
+        print(f"[WARN] num_sampled ({config.num_sampled}) >= vocabulary size ({vocab_size}), "
+              f"training with the full softmax")
+    elif config.softmax != "full":
+        raise ValueError(f"未知的 softmax 方式：{config.softmax}")
     model.compile(
         loss="sparse_categorical_crossentropy",
         optimizer="adam",
         metrics=["accuracy"]
     )
-    model.fit(
-        train_sequences,
-        target_sequences,
-        batch_size=config.batch_size,
-        epochs=config.epochs
+    return model
+
+
+def evaluate_perplexity(model: keras.Model, train_sequences: np.ndarray, target_sequences: np.ndarray,
+                        rows: np.ndarray, batch_size: int = 256) -> float:
+    """
+    Perplexity of the full-softmax model on the given rows, over the non-padding targets.
+    """
+    total, count = 0.0, 0
+    for start in range(0, len(rows), batch_size):
+        inputs, targets, weights = gather_batch(train_sequences, target_sequences, rows[start:start + batch_size],
+                                                mask_padding=True)
+        probabilities = keras.ops.convert_to_numpy(model(inputs, training=False))
+        target_probabilities = np.take_along_axis(probabilities, targets[..., None], axis=-1)[..., 0]
+        total -= float(np.sum(np.log(np.maximum(target_probabilities, 1e-12)) * weights))
+        count += float(weights.sum())
+    return math.exp(total / max(count, 1.0))
+
+
+class SequenceBatches(keras.utils.PyDataset):
+    """
+    Shuffled (inputs, targets) batches read from the token matrices on demand.
+
+    Only one batch is copied out of the (possibly memory-mapped) arrays at a time, instead of
+    Keras converting the whole training set into in-memory tensors before fitting.
+
+    :param rows: optional subset of row indices to iterate over (e.g. a train or validation split)
+    """
+
+    def __init__(self, train_sequences: np.ndarray, target_sequences: np.ndarray, batch_size: int,
+                 shuffle: bool = True, seed: int = 42, mask_padding: bool = False, rows: np.ndarray = None,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.train_sequences = train_sequences
+        self.target_sequences = target_sequences
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.mask_padding = mask_padding
+        self._rng = np.random.default_rng(seed)
+        self._order = np.arange(len(train_sequences)) if rows is None else np.array(rows)
+        self.on_epoch_end()
+
+    def __len__(self) -> int:
+        return math.ceil(len(self._order) / self.batch_size)
+
+    def __getitem__(self, index: int):
+        rows = self._order[index * self.batch_size:(index + 1) * self.batch_size]
+        return gather_batch(self.train_sequences, self.target_sequences, rows, self.mask_padding)
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._rng.shuffle(self._order)
+
+
+def make_tf_dataset(train_sequences: np.ndarray, target_sequences: np.ndarray, batch_size: int,
+                    shuffle_buffer: int = 10000, seed: int = 42, mask_padding: bool = False) -> tf.data.Dataset:
+    """
+    Streaming tf.data pipeline over the (possibly memory-mapped) token matrices.
+
+    Row indices are shuffled within a bounded buffer and batched; the rows of each batch are
+    then gathered from the arrays in parallel map calls and prefetched, so reading overlaps
+    with the training step and the data never has to fit in memory.
+    """
+    sequence_length = train_sequences.shape[1]
+    output_types = (tf.int32, tf.int32, tf.float32) if mask_padding else (tf.int32, tf.int32)
+
+    def load_batch(rows):
+        batch = tf.numpy_function(lambda r: gather_batch(train_sequences, target_sequences, r, mask_padding),
+                                  [rows], output_types)
+        for tensor in batch:
+            tensor.set_shape((None, sequence_length))
+        return tuple(batch)
+
+    return (
+        tf.data.Dataset.range(len(train_sequences))
+        .shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        .batch(batch_size)
+        .map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
     )
 
+
+class StepsPerSecond(keras.callbacks.Callback):
+    """
+    Print the time and training steps per second of each epoch, to compare input pipelines
+    and softmax modes.
+    """
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps = 0
+        self._start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._start
+        print(f"[INFO] epoch {epoch + 1}: {self._steps} steps in {elapsed:.1f}s, "
+              f"{self._steps / elapsed:.2f} steps/sec")
+
+
+def make_training_data(train_sequences: np.ndarray, target_sequences: np.ndarray, config: Config):
+    # The multi-genre corpus pads the shorter genres up to the longest one
+    mask_padding = config.multi_genre
+    if config.input_pipeline == "tf.data":
+        return make_tf_dataset(train_sequences, target_sequences, config.batch_size, config.shuffle_buffer,
+                               mask_padding=mask_padding)
+    if config.input_pipeline == "pydataset":
+        return SequenceBatches(train_sequences, target_sequences, config.batch_size, mask_padding=mask_padding)
+    raise ValueError(f"未知的输入管道：{config.input_pipeline}")
+
+
+def train_model(train_sequences, target_sequences, tokenizer: Tokenizer, config: Config):
+    model_name = MULTI_GENRE_NAME if config.multi_genre else config.genre.name
+
+    # --- Build model (simple LSTM decoder) ---
+    model = build_model(config, tokenizer.vocabulary_size)
+    model.summary()
+
+    # --- Train model ---
+    trainer = compile_for_training(model, config)
+    trainer.fit(
+        make_training_data(train_sequences, target_sequences, config),
+        epochs=config.epochs,
+        callbacks=[StepsPerSecond()]
+    )
+
+    # Full-softmax perplexity on a fixed sample of the training rows, comparable across --softmax modes
+    rows = np.random.default_rng(0).permutation(len(train_sequences))[:PERPLEXITY_SAMPLE_ROWS]
+    perplexity = evaluate_perplexity(model, train_sequences, target_sequences, rows, config.batch_size)
+    print(f"[INFO] Perplexity (full softmax, {len(rows)} training rows): {perplexity:.2f}")
+
     # --- Save model ---
     os.makedirs('models', exist_ok=True)
-    model_path = f'models/{genre.name}_lstm_model-epoch{config.epochs}.keras'
+    model_path = f'models/{model_name}_lstm_model-epoch{config.epochs}.keras'
     model.save(model_path)
     print(f"[INFO] Model saved to: {model_path}")
 
-    # --- Generate sample text (demo) ---
-    poem_generator = PoemGenerator(
-        vectorization_model=text_vectorization,
-        generation_model=model,
-        genre=genre
-    )
-    demo_output = poem_generator.generate("海外", temperature=0)
-    print("[DEMO] Generated poem:", demo_output)
+    # --- Generate sample text (demo); a multi-genre model writes every genre ---
+    for genre in (list(Genre) if config.multi_genre else [config.genre]):
+        poem_generator = PoemGenerator(
+            tokenizer=tokenizer,
+            generation_model=model,
+            genre=genre
+        )
+        demo_output = poem_generator.generate("海外", temperature=0)
+        print(f"[DEMO] Generated poem ({genre.genre_name}):", demo_output)
@@ -18,6 +18,12 @@ def _non_neg_int(option_name: str, x: str) -> int:
         raise argparse.ArgumentTypeError(f"{option_name} 必须为非负整数")
     return v
 
+def _positive_int(option_name: str, x: str) -> int:
+    v = int(x)
+    if v <= 0:
+        raise argparse.ArgumentTypeError(f"{option_name} 必须为正整数")
+    return v
+
 def _parse_genre(s: str) -> Genre:
     s_raw = s.strip()
     s_up = s_raw.upper()
@@ -41,25 +47,78 @@ def _parse_genre(s: str) -> Genre:
     )
 
 
+def add_training_arguments(parser: argparse.ArgumentParser, epochs: int = 50):
+    """
+    训练数据、词表与训练目标的参数（train.py 与 sweep.py 共用）；模型规模参数见 add_model_arguments
+    """
+    parser.add_argument("-g", "--genre", type=_parse_genre,
+                        help="体裁：可用 WUJUE/五绝，QIJUE/七绝，WULV/五律，QILV/七律 等（--multi-genre 时不需要）")
+    parser.add_argument("--multi-genre", action="store_true",
+                        help="用共享词表训练一个以体裁 token 为条件的模型，同时服务全部体裁")
+    parser.add_argument("-e", "--epochs", type=partial(_positive_int, "epochs"), default=epochs,
+                        help=f"训练轮数（默认 {epochs}）")
+    parser.add_argument("-n", "--dataset-number", type=partial(_non_neg_int, "dataset_number"), default=0,
+                        help="限制用于训练的数据条数（默认 0 表示不限制）")
+    parser.add_argument("-w", "--num-workers", "--workers", type=partial(_non_neg_int, "num_workers"), default=0,
+                        help="并行读取数据集的进程数（默认 0 表示每个 CPU 一个进程）")
+    parser.add_argument("--no-corpus-cache", dest="corpus_cache", action="store_false",
+                        help="不读取也不写入清洗后语料的缓存（data/cache）")
+    parser.add_argument("--max-tokens", "--max-vocabulary-size", type=partial(_non_neg_int, "max_tokens"), default=0,
+                        help="词表大小上限（含填充符与 [UNK]），只保留最常见的字，其余编码为 [UNK]（默认 0 表示不限制）")
+    parser.add_argument("--min-count", type=partial(_positive_int, "min_count"), default=1,
+                        help="字在语料中至少出现的次数，更少的编码为 [UNK]（默认 1）")
+    parser.add_argument("--softmax", choices=["full", "sampled"], default="full",
+                        help="训练目标：full 为完整 softmax；sampled 每步只计算目标字与 --num-sampled 个采样负类，"
+                             "训练更快，保存的模型推理时仍使用完整 softmax（默认 full）")
+    parser.add_argument("--num-sampled", type=partial(_positive_int, "num_sampled"), default=512,
+                        help="sampled softmax 每步采样的负类数（默认 512）")
+    parser.add_argument("--dedup", choices=["none", "exact", "near"], default="exact",
+                        help="清洗后去除重复的诗：exact 去除内容完全相同的；near 另外用 MinHash/LSH 去除"
+                             "字 n-gram 相似度不低于 --near-duplicate-threshold 的近似重复（默认 exact）")
+    parser.add_argument("--near-duplicate-threshold", type=partial(_float_0_1, "near_duplicate_threshold"),
+                        default=0.8, help="近似重复的 Jaccard 相似度阈值，取值 [0,1)（默认 0.8）")
+
+
+def add_model_arguments(parser: argparse.ArgumentParser, multiple: bool = False):
+    """
+    模型规模与 batch 参数；multiple=True 时每个参数可给多个候选值（sweep.py 的搜索空间）
+    """
+    nargs = "+" if multiple else None
+    wrap = (lambda value: [value]) if multiple else (lambda value: value)
+    suffix = "的候选值" if multiple else ""
+    parser.add_argument("-b", "--batch-size", type=partial(_positive_int, "batch_size"), nargs=nargs,
+                        default=wrap(256), help=f"Batch size{' ' + suffix if multiple else ''}（默认 256）")
+    parser.add_argument("--embedding-dim", "--embed-dim", type=partial(_positive_int, "embedding_dim"), nargs=nargs,
+                        default=wrap(100), help=f"Embedding 维度{suffix}（默认 100）")
+    parser.add_argument("-u", "--lstm-units", type=partial(_positive_int, "lstm_units"), nargs=nargs,
+                        default=wrap(512), help=f"LSTM 单元数{suffix}（默认 512）")
+    parser.add_argument("-p", "--dropout-rate", "--dropout", type=partial(_float_0_1, "dropout_rate"), nargs=nargs,
+                        default=wrap(0.1), help=f"Dropout 比例{suffix}，取值 [0,1)（默认 0.1）")
+
+
+def check_training_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if args.multi_genre:
+        args.genre = None
+    elif args.genre is None:
+        parser.error("必须指定 --genre（或使用 --multi-genre）")
+    if 0 < args.max_tokens < 3:
+        parser.error("--max-tokens 至少为 3（填充符、[UNK] 与一个字）")
+
+
 def get_config_from_cli() -> Config:
     parser = argparse.ArgumentParser(
         description="诗歌 LSTM 训练参数（仅 --genre 必填，其余有默认值）"
     )
-    parser.add_argument("-g", "--genre", required=True, type=_parse_genre,
-                        help="体裁：可用 WUJUE/五绝，QIJUE/七绝，WULV/五律，QILV/七律 等")
-    parser.add_argument("-b", "--batch-size", type=int, default=256,
-                        help="Batch size（默认 256）")
-    parser.add_argument("-e", "--epochs", type=int, default=50,
-                        help="训练轮数（默认 50）")
-    parser.add_argument("--embedding-dim", "--embed-dim", type=int, default=100,
-                        help="Embedding 维度（默认 100）")
-    parser.add_argument("-u", "--lstm-units", type=int, default=512,
-                        help="LSTM 单元数（默认 512）")
-    parser.add_argument("-p", "--dropout-rate", "--dropout", type=partial(_float_0_1, "dropout_rate"), default=0.1,
-                        help="Dropout 比例，取值 [0,1)（默认 0.1）")
-    parser.add_argument("-n", "--dataset-number", type=partial(_non_neg_int, "dataset_number"), default=0,
-                        help="限制用于训练的数据条数（默认 0 表示不限制）")
+    add_training_arguments(parser)
+    add_model_arguments(parser)
+    # sweep.py 的试验总是按 batch 读取内存映射的编码语料，输入管道参数只属于 train.py
+    parser.add_argument("--input-pipeline", choices=["pydataset", "tf.data"], default="pydataset",
+                        help="训练输入管道：pydataset 按 batch 读取并全局打乱；tf.data 流式读取，"
+                             "在有限的缓冲区内打乱并并行预取（默认 pydataset）")
+    parser.add_argument("--shuffle-buffer", type=partial(_positive_int, "shuffle_buffer"), default=10000,
+                        help="tf.data 管道的打乱缓冲区大小（默认 10000）")
 
     args = parser.parse_args()
+    check_training_arguments(parser, args)
     cfg = Config(**vars(args))
     return cfg
@@ -1,13 +1,33 @@
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import List
 
+import numpy as np
 import pandas as pd
 
-from poem.genre import Genre
+from poem.genre import Genre, PUNCTUATIONS
 from train.config import Config
 
 DATASET_DIRECTORY = 'data/Poetry/诗歌数据集'
-VALID_PUNCTUATIONS = set("！，？。")
+CORPUS_CACHE_DIRECTORY = 'data/cache'
+VALID_PUNCTUATIONS = set(PUNCTUATIONS)
+_VALID_PUNCTUATION_CODES = np.array(sorted(ord(p) for p in VALID_PUNCTUATIONS), dtype=np.uint32)
+# Only these columns are parsed from the CSV files
+USED_COLUMNS = ["体裁", "内容"]
+# Bump when the cleaning rules change, so that old cached corpora are not reused
+CORPUS_CACHE_VERSION = 2
+# Deduplication after the checks: "none", "exact" (same text) or "near" (exact, then MinHash/LSH)
+DEDUP_METHODS = ("none", "exact", "near")
+# Near-duplicate detection: character n-grams, MinHash signature split into LSH bands
+SHINGLE_SIZE = 2
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+# Poems per chunk when computing shingles and signatures and verifying candidate pairs (bounds the temporary arrays)
+DEDUP_CHUNK_ROWS = 1024
 
 
 # ===== File utilities =====
@@ -17,7 +37,9 @@ def get_all_files(base_dir: str) -> List[str]:
     """
     all_files = []
     for root, dirs, files in os.walk(base_dir):
-        for file in files:
+        # Sorted, so that the order of the poems (and the first occurrence kept by dedup) is reproducible
+        dirs.sort()
+        for file in sorted(files):
             all_files.append(os.path.join(root, file))
     return all_files
 
@@ -29,12 +51,29 @@ def read_file_to_pandas(file_path: str, genre_name: str) -> pd.Series:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File {file_path} does not exist.")
 
-    df = pd.read_csv(file_path)
+    df = pd.read_csv(file_path, usecols=USED_COLUMNS, dtype=str)
     filter_by_genre = df[df["体裁"].astype(str).str.contains(genre_name, na=False)].copy()
     poems = filter_by_genre['内容']
     return poems
 
 
+def read_files_to_pandas(file_paths: List[str], genre_name: str, num_workers: int = 0) -> pd.Series:
+    """
+    Read the CSV files in parallel and return one Series of poem contents indexed by (dynasty, row).
+
+    :param num_workers: int, number of worker processes. 0 means one per CPU, 1 reads serially
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    read_file = partial(read_file_to_pandas, genre_name=genre_name)
+    if num_workers == 1 or len(file_paths) == 1:
+        list_of_poems = [read_file(file_path) for file_path in file_paths]
+    else:
+        with ProcessPoolExecutor(min(num_workers, len(file_paths))) as executor:
+            list_of_poems = list(executor.map(read_file, file_paths))
+    dynasty_list = [extract_dynasty_from_filename(file) for file in file_paths]
+    return pd.concat(list_of_poems, keys=dynasty_list)
+
+
 def extract_dynasty_from_filename(file_path: str) -> str:
     """
     Extract the dynasty from the file name.
@@ -88,57 +127,268 @@ def check_poems(poem_texts: pd.Series, genre: Genre) -> pd.Series:
     """
     Check the poems Series using the above checking functions and return the mask values (True/False) for each poem text.
 
+    The checks are the same as `check_poem`, but done for all poems at once on a
+    (poems, length) array of code points instead of once per poem.
+
     :param poem_texts: pd.Series, the series of poem texts, it supports MultiIndex
     :param genre: Genre(Enum), the genre rule applied to check
     :return: pd.Series of bool, the mask values for each poem text, with the same index as input
     """
-    from functools import partial
+    poem_length = genre.length
+    values = poem_texts.to_numpy(dtype=object)
+    # Guard: some items may not be string, e.g. float('nan')
+    is_text = np.fromiter((type(text) is str for text in values), dtype=bool, count=len(values))
+
+    # Fixed-width UTF-32 array: casting slices each text to the poem length BEFORE checking,
+    # consistent with the notebook, and pads shorter texts with code point 0
+    texts = np.asarray(np.where(is_text, values, ""), dtype=f"<U{poem_length}")
+    code_points = texts.view(np.uint32).reshape(len(texts), poem_length)
 
-    check_for_current_genre = partial(check_poem, rows=genre.rows, cols=genre.cols)
-    # Slice to length BEFORE checking, consistent with the notebook
-    mask = poem_texts.str[:genre.length].apply(check_for_current_genre)
-    return mask
+    # The last punctuation position is the last character, so a valid punctuation there
+    # also means the text has exactly `poem_length` characters
+    at_positions = code_points[:, genre.punctuation_positions]
+    mask = is_text & np.isin(at_positions, _VALID_PUNCTUATION_CODES).all(axis=1)
+    return pd.Series(mask, index=poem_texts.index)
 
 
 def report_check_results(mask: pd.Series):
     return len(mask), int(mask.sum()), f"{mask.mean() * 100:.2f}%"
 
 
-def read_poem_text(config: Config):
-    current_genre = config.genre
+# ===== Deduplication =====
+def exact_duplicates(poem_texts: pd.Series) -> np.ndarray:
+    """
+    Mask of the poems whose text already appeared earlier in the Series.
 
-    # --- Collect files ---
-    base_dir = os.path.expanduser(DATASET_DIRECTORY)
-    poem_files = get_all_files(base_dir)  # format #{DATASET_DIRECTORY}/XXX.txt
-    if not poem_files:
-        raise RuntimeError(f"No files found under {base_dir}")
+    Only a 64-bit hash per poem is kept, not a set of the texts.
+    """
+    hashes = pd.util.hash_pandas_object(poem_texts, index=False).to_numpy()
+    return pd.Series(hashes).duplicated(keep="first").to_numpy()
 
-    # --- Demo: single file read & quick checks ---
-    demo_file = poem_files[16] if len(poem_files) > 16 else poem_files[0]
-    print(f"[INFO] Demo file: {demo_file}")
 
-    one_dynasty_poems = read_file_to_pandas(demo_file, current_genre.genre_name)
-    print("[INFO] one_dynasty_poems.shape =", one_dynasty_poems.shape)
+def _shingles(poem_texts: pd.Series, genre: Genre) -> np.ndarray:
+    """
+    (poems, shingles) uint64 array: each character n-gram of the poem without its punctuation,
+    packed as 21 bits per code point.
+    """
+    texts = np.asarray(poem_texts.to_numpy(dtype=object), dtype=f"<U{genre.length}")
+    code_points = texts.view(np.uint32).reshape(len(texts), genre.length).astype(np.uint64)
+    punctuation = set(genre.punctuation_positions)
+    chars = code_points[:, [i for i in range(genre.length) if i not in punctuation]]
+    width = chars.shape[1] - SHINGLE_SIZE + 1
+    shingles = np.zeros((len(chars), width), dtype=np.uint64)
+    for k in range(SHINGLE_SIZE):
+        shingles |= chars[:, k:k + width] << np.uint64(21 * k)
+    return shingles
+
+
+def _lsh_band_hashes(poem_texts: pd.Series, genre: Genre, seed: int = 0) -> np.ndarray:
+    """
+    (poems, LSH_BANDS) uint64 array: the hash of each band of the poems' MinHash signatures.
+    Poems sharing any band hash are candidate near duplicates.
 
-    # validate one sample
-    sample_ok = check_poem(one_dynasty_poems.iloc[0], current_genre.rows, current_genre.cols)
-    print("[INFO] first poem valid? ->", sample_ok)
+    The shingles are computed one chunk of poems at a time and dropped with it.
+    """
+    rng = np.random.default_rng(seed)
+    # Multiply-add-shift hash functions, one per permutation; odd multipliers
+    multipliers = rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+    rows_per_band = MINHASH_PERMUTATIONS // LSH_BANDS
+    band_mixers = rng.integers(0, 2 ** 63, rows_per_band, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    band_hashes = np.empty((len(poem_texts), LSH_BANDS), dtype=np.uint64)
+    for start in range(0, len(poem_texts), DEDUP_CHUNK_ROWS):
+        chunk = _shingles(poem_texts.iloc[start:start + DEDUP_CHUNK_ROWS], genre)[:, :, None]
+        signatures = ((chunk * multipliers + offsets) >> np.uint64(32)).min(axis=1)
+        bands = signatures[:, :LSH_BANDS * rows_per_band].reshape(len(signatures), LSH_BANDS, rows_per_band)
+        band_hashes[start:start + len(signatures)] = (bands * band_mixers).sum(axis=2)
+    return band_hashes
+
+
+def _jaccard(poem_texts: pd.Series, genre: Genre, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Exact Jaccard similarity of the shingle sets of the poem pairs (left[k], right[k]),
+    recomputing the shingles of the paired poems one chunk of pairs at a time.
+    """
+    similarity = np.empty(len(left))
+    for start in range(0, len(left), DEDUP_CHUNK_ROWS):
+        a = _shingles(poem_texts.iloc[left[start:start + DEDUP_CHUNK_ROWS]], genre)
+        b = _shingles(poem_texts.iloc[right[start:start + DEDUP_CHUNK_ROWS]], genre)
+        # Count each distinct shingle once: skip values repeated earlier in the same poem
+        first_a = ~np.tril(a[:, :, None] == a[:, None, :], -1).any(axis=2)
+        first_b = ~np.tril(b[:, :, None] == b[:, None, :], -1).any(axis=2)
+        common = (first_a & (a[:, :, None] == b[:, None, :]).any(axis=2)).sum(axis=1)
+        union = first_a.sum(axis=1) + first_b.sum(axis=1) - common
+        similarity[start:start + len(a)] = common / union
+    return similarity
+
+
+def near_duplicates(poem_texts: pd.Series, genre: Genre, threshold: float = 0.8) -> np.ndarray:
+    """
+    Mask of the poems with a character n-gram Jaccard similarity of at least `threshold` to an
+    earlier poem in the Series, directly or through a chain of such poems.
+
+    Candidates come from MinHash/LSH: poems sharing a band hash, compared with their neighbour
+    in the band's sorted order. Each candidate pair is then verified on the exact Jaccard
+    similarity, so the LSH only affects recall. Besides the texts, only the band hashes
+    (LSH_BANDS per poem) and the candidate pairs are kept for the whole pass; shingles exist
+    for one chunk of poems or pairs at a time.
+    """
+    if len(poem_texts) < 2:
+        return np.zeros(len(poem_texts), dtype=bool)
+    band_hashes = _lsh_band_hashes(poem_texts, genre)
+
+    pairs = []
+    for band in range(LSH_BANDS):
+        order = np.argsort(band_hashes[:, band], kind="stable")
+        same = band_hashes[order[1:], band] == band_hashes[order[:-1], band]
+        pairs.append(np.stack([order[:-1][same], order[1:][same]], axis=1))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    pairs = pairs[_jaccard(poem_texts, genre, pairs[:, 0], pairs[:, 1]) >= threshold]
+
+    # Union-find over the verified pairs; each group keeps its earliest poem
+    parent = np.arange(len(poem_texts))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    duplicate = np.zeros(len(poem_texts), dtype=bool)
+    for i in np.unique(pairs):
+        duplicate[i] = find(i) != i
+    return duplicate
+
+
+def deduplicate(poem_texts: pd.Series, genre: Genre, method: str = "exact", threshold: float = 0.8) -> pd.Series:
+    """
+    Drop repeated poems, keeping the first occurrence, and report the removed rows per dynasty.
+
+    :param poem_texts: pd.Series of checked poem texts, indexed by (dynasty, row)
+    :param method: "none", "exact" (identical texts) or "near" (exact, then near duplicates)
+    :param threshold: float, the character n-gram Jaccard similarity from which poems are near duplicates
+    """
+    if method not in DEDUP_METHODS:
+        raise ValueError(f"未知的去重方式：{method}")
+    if method == "none":
+        return poem_texts
+    exact = exact_duplicates(poem_texts)
+    near = np.zeros(len(poem_texts), dtype=bool)
+    if method == "near":
+        near[~exact] = near_duplicates(poem_texts[~exact], genre, threshold)
+
+    removed = pd.DataFrame({"total": 1, "exact": exact, "near": near}, index=poem_texts.index)
+    by_dynasty = removed.groupby(level=0, sort=False).sum()
+    for dynasty, row in by_dynasty.iterrows():
+        print(f"[INFO] dedup {dynasty}: total={row['total']}, exact={row['exact']}, near={row['near']}, "
+              f"kept={row['total'] - row['exact'] - row['near']}")
+    print(f"[INFO] dedup all dynasties: removed exact={int(exact.sum())}, near={int(near.sum())}, "
+          f"kept={int((~exact & ~near).sum())} of {len(poem_texts)}")
+    return poem_texts[~exact & ~near]
+
+
+# ===== Cleaned corpus cache =====
+def corpus_fingerprint(poem_files: List[str], genre: Genre, dedup: str = "exact", threshold: float = 0.8) -> str:
+    """
+    Fingerprint of the source files (path, size, modification time), of the genre rules and of
+    the deduplication settings.
+    """
+    sources = []
+    for file_path in sorted(poem_files):
+        stat = os.stat(file_path)
+        sources.append([file_path, stat.st_size, stat.st_mtime_ns])
+    rules = {
+        "version": CORPUS_CACHE_VERSION,
+        "genre": [genre.name, genre.genre_name, genre.rows, genre.cols],
+        "punctuations": sorted(VALID_PUNCTUATIONS),
+        "columns": USED_COLUMNS,
+        "dedup": {"method": dedup},
+    }
+    if dedup == "near":
+        rules["dedup"].update(threshold=threshold, shingle_size=SHINGLE_SIZE,
+                              permutations=MINHASH_PERMUTATIONS, bands=LSH_BANDS)
+    payload = json.dumps({"sources": sources, "rules": rules}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def corpus_cache_path(genre: Genre, fingerprint: str, cache_dir: str = CORPUS_CACHE_DIRECTORY) -> str:
+    # Parquet when pyarrow is installed, pickle otherwise
+    extension = "parquet" if _parquet_available() else "pkl"
+    return os.path.join(cache_dir, f"{genre.name}_corpus_{fingerprint}.{extension}")
 
-    mask = check_poems(one_dynasty_poems, current_genre)
-    print("[INFO] demo dynasty report:", report_check_results(mask))
 
-    # --- Read ALL files into a MultiIndex Series ---
-    list_of_poems = [read_file_to_pandas(file_path, current_genre.genre_name) for file_path in poem_files]
-    dynasty_list = [extract_dynasty_from_filename(file) for file in poem_files]
-    all_dynasty_poems = pd.concat(list_of_poems, keys=dynasty_list)
+def load_cached_corpus(path: str) -> pd.Series | None:
+    if not os.path.exists(path):
+        return None
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)["内容"]
+    return pd.read_pickle(path)
+
+
+def save_cached_corpus(cleaned_poems: pd.Series, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first, so an interrupted run never leaves a truncated cache behind
+    tmp_path = f"{path}.tmp"
+    if path.endswith(".parquet"):
+        cleaned_poems.to_frame("内容").to_parquet(tmp_path)
+    else:
+        cleaned_poems.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def clean_corpus(poem_files: List[str], genre: Genre, num_workers: int = 0, dedup: str = "exact",
+                 threshold: float = 0.8) -> pd.Series:
+    """
+    Read all files, keep the poems that pass the genre checks, sliced to the poem length,
+    and drop the repeated ones (see `deduplicate`).
+    """
+    all_dynasty_poems = read_files_to_pandas(poem_files, genre.genre_name, num_workers)
 
     # --- Apply checks across all ---
-    mask_all = check_poems(all_dynasty_poems, current_genre)
+    mask_all = check_poems(all_dynasty_poems, genre)
     total, passed, ratio = report_check_results(mask_all)
     print(f"[INFO] all dynasties report: total={total}, passed={passed}, ratio={ratio}")
 
-    cleaned_poems = all_dynasty_poems[mask_all].str[:current_genre.length]
-    print("[INFO] cleaned_poems.shape =", cleaned_poems.shape)
+    checked_poems = all_dynasty_poems[mask_all].str[:genre.length]
+    return deduplicate(checked_poems, genre, dedup, threshold)
+
+
+def read_poem_text(config: Config):
+    current_genre = config.genre
+
+    # --- Collect files ---
+    base_dir = os.path.expanduser(DATASET_DIRECTORY)
+    poem_files = get_all_files(base_dir)  # format #{DATASET_DIRECTORY}/XXX.txt
+    if not poem_files:
+        raise RuntimeError(f"No files found under {base_dir}")
+
+    # --- Cleaned corpus: from the cache when the sources and rules are unchanged ---
+    start = time.perf_counter()
+    fingerprint = corpus_fingerprint(poem_files, current_genre, config.dedup, config.near_duplicate_threshold)
+    cache_path = corpus_cache_path(current_genre, fingerprint)
+    cleaned_poems = load_cached_corpus(cache_path) if config.corpus_cache else None
+    if cleaned_poems is not None:
+        print(f"[INFO] Loaded cleaned corpus from cache: {cache_path}")
+    else:
+        cleaned_poems = clean_corpus(poem_files, current_genre, config.num_workers, config.dedup,
+                                     config.near_duplicate_threshold)
+        if config.corpus_cache:
+            save_cached_corpus(cleaned_poems, cache_path)
+            print(f"[INFO] Cleaned corpus cached to: {cache_path}")
+    print(f"[INFO] cleaned_poems.shape = {cleaned_poems.shape} ({time.perf_counter() - start:.1f}s)")
 
     # --- Only select specific number data samples ---
     if config.dataset_number > 0:
@@ -0,0 +1,235 @@
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import asdict, replace
+
+import numpy as np
+
+from train.config import Config
+from train.vectorization_model import MULTI_GENRE_NAME, prepare_training_tokens, token_cache_paths
+
+# The Config fields a sweep varies
+SWEEP_PARAMETERS = ("lstm_units", "embedding_dim", "batch_size", "dropout_rate")
+RESULT_COLUMNS = ("trial", *SWEEP_PARAMETERS, "status", "epochs", "val_loss", "val_perplexity",
+                  "wall_seconds", "steps_per_sec", "model_path")
+
+
+def sweep_trials(grid: dict[str, list], search: str = "grid", num_trials: int = 0, seed: int = 0) -> list[dict]:
+    """
+    The parameter sets to try: every combination of `grid` ("grid"), or `num_trials` combinations
+    drawn at random from it ("random").
+    """
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if search == "grid":
+        return combinations
+    if search == "random":
+        rng = np.random.default_rng(seed)
+        return [combinations[i] for i in rng.permutation(len(combinations))[:num_trials or len(combinations)]]
+    raise ValueError(f"未知的搜索方式：{search}")
+
+
+def split_rows(num_rows: int, validation_fraction: float, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (train rows, validation rows): a fixed random split, the same for every trial.
+    """
+    order = np.random.default_rng(seed).permutation(num_rows)
+    num_validation = max(1, int(num_rows * validation_fraction))
+    return np.sort(order[num_validation:]), np.sort(order[:num_validation])
+
+
+class MedianStoppingRule:
+    """
+    Stops a trial whose best validation loss after an epoch is worse than the median of the
+    best losses other trials had reached by that epoch, by more than `margin` (relative).
+
+    The trials run in separate processes and share their per-epoch losses through one JSON
+    file per trial in `history_dir`. A negative `margin` never stops a trial.
+    """
+
+    def __init__(self, history_dir: str, min_epochs: int = 1, min_trials: int = 3, margin: float = 0.1):
+        self.history_dir = history_dir
+        self.min_epochs = min_epochs
+        self.min_trials = min_trials
+        self.margin = margin
+
+    def record(self, trial: int, val_losses: list[float]):
+        path = os.path.join(self.history_dir, f"trial_{trial}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(val_losses, f)
+        os.replace(path + ".tmp", path)
+
+    def should_stop(self, trial: int, val_losses: list[float]) -> bool:
+        epoch = len(val_losses)
+        if self.margin < 0 or epoch < self.min_epochs:
+            return False
+        others = []
+        for name in os.listdir(self.history_dir):
+            if name.endswith(".json") and name != f"trial_{trial}.json":
+                with open(os.path.join(self.history_dir, name), "r", encoding="utf-8") as f:
+                    losses = json.load(f)
+                if len(losses) >= epoch:
+                    others.append(min(losses[:epoch]))
+        if len(others) < self.min_trials:
+            return False
+        return min(val_losses) > statistics.median(others) * (1 + self.margin)
+
+
+# Read by the BLAS / OpenMP runtimes when they load, i.e. when the trial process imports numpy
+THREAD_ENVIRONMENT_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+@contextmanager
+def _thread_environment(threads: int):
+    """
+    Set the BLAS / OpenMP thread counts in this process's environment, which spawned trial
+    processes inherit, and restore it afterwards.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_ENVIRONMENT_VARIABLES}
+    os.environ.update({name: str(threads) for name in THREAD_ENVIRONMENT_VARIABLES})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_trial_process(threads: int):
+    # Per-trial thread budget, set before TensorFlow creates its thread pools
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+
+
+def run_trial(trial: int, config: Config, vocabulary_size: int, tokens_path: str, validation_fraction: float,
+              output_dir: str, stopping: MedianStoppingRule) -> dict:
+    """
+    Train one trial on the memory-mapped token matrix and return its row of the results table.
+    """
+    import keras
+    from train.generation_model import SequenceBatches, build_model, compile_for_training, evaluate_perplexity
+
+    token_ids = np.load(tokens_path, mmap_mode="r")
+    train_sequences, target_sequences = token_ids[:, :-1], token_ids[:, 1:]
+    train_rows, validation_rows = split_rows(len(token_ids), validation_fraction)
+
+    keras.utils.set_random_seed(trial)
+    model = build_model(config, vocabulary_size)
+    trainer = compile_for_training(model, config)
+    result = {"trial": trial, **{name: getattr(config, name) for name in SWEEP_PARAMETERS}}
+
+    class Evaluate(keras.callbacks.Callback):
+        """
+        Full-softmax validation loss after each epoch (comparable across softmax modes),
+        training steps per second, and the stopping rule.
+        """
+
+        def on_train_begin(self, logs=None):
+            self.val_losses, self.steps, self.train_seconds = [], 0, 0.0
+            self.status = "completed"
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self._start = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.steps += 1
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.train_seconds += time.perf_counter() - self._start
+            if logs and not math.isfinite(logs.get("loss", 0.0)):
+                self.status = "diverged"
+                trainer.stop_training = True
+                return
+            perplexity = evaluate_perplexity(model, train_sequences, target_sequences, validation_rows,
+                                             config.batch_size)
+            self.val_losses.append(math.log(perplexity))
+            stopping.record(trial, self.val_losses)
+            print(f"[INFO] trial {trial} epoch {epoch + 1}: val_loss {self.val_losses[-1]:.4f}", flush=True)
+            if epoch + 1 < config.epochs and stopping.should_stop(trial, self.val_losses):
+                self.status = "stopped"
+                trainer.stop_training = True
+
+    evaluate = Evaluate()
+    start = time.perf_counter()
+    trainer.fit(
+        SequenceBatches(train_sequences, target_sequences, config.batch_size, seed=trial,
+                        mask_padding=config.multi_genre, rows=train_rows),
+        epochs=config.epochs,
+        callbacks=[evaluate],
+        verbose=0,
+    )
+    model_path = os.path.join(output_dir, f"trial_{trial}.keras")
+    model.save(model_path)
+
+    best = min(evaluate.val_losses) if evaluate.val_losses else float("nan")
+    result.update(status=evaluate.status, epochs=len(evaluate.val_losses), val_loss=best,
+                  val_perplexity=math.exp(best) if evaluate.val_losses else float("nan"),
+                  wall_seconds=time.perf_counter() - start,
+                  steps_per_sec=evaluate.steps / evaluate.train_seconds if evaluate.train_seconds else 0.0,
+                  model_path=model_path)
+    return result
+
+
+def run_sweep(base_config: Config, trials: list[dict], output_dir: str, parallel: int, threads_per_trial: int,
+              validation_fraction: float = 0.1, stopping: MedianStoppingRule = None) -> list[dict]:
+    """
+    Prepare the corpus and token matrix once, then train the trials `parallel` at a time, each in its
+    own process limited to `threads_per_trial` threads. Rows are appended to `results.csv` in
+    `output_dir` as trials finish.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stopping = stopping or MedianStoppingRule(os.path.join(output_dir, "history"))
+    # Curves left by an earlier sweep into the same directory must not count as peers
+    shutil.rmtree(stopping.history_dir, ignore_errors=True)
+    os.makedirs(stopping.history_dir)
+
+    # Goes through the corpus and token caches; the trials memory-map the saved token matrix
+    _, _, tokenizer = prepare_training_tokens(base_config)
+    name = MULTI_GENRE_NAME if base_config.multi_genre else base_config.genre.name
+    tokens_path = token_cache_paths(name)[0]
+    if not os.path.exists(tokens_path):
+        raise FileNotFoundError(f"未找到编码后的语料：{tokens_path}")
+
+    with open(os.path.join(output_dir, "sweep.json"), "w", encoding="utf-8") as f:
+        json.dump({"base_config": asdict(base_config) | {"genre": name}, "trials": trials,
+                   "validation_fraction": validation_fraction, "threads_per_trial": threads_per_trial}, f, indent=2)
+
+    results = []
+    results_path = os.path.join(output_dir, "results.csv")
+    executor = ProcessPoolExecutor(parallel, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_trial_process, initargs=(threads_per_trial,))
+    # The trial processes are spawned while trials are submitted, inside the thread environment
+    with _thread_environment(threads_per_trial), executor, \
+            open(results_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        futures = {
+            executor.submit(run_trial, trial, replace(base_config, **params), tokenizer.vocabulary_size,
+                            tokens_path, validation_fraction, output_dir, stopping): (trial, params)
+            for trial, params in enumerate(trials)
+        }
+        for future in as_completed(futures):
+            trial, params = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[WARN] trial {trial} failed: {type(e).__name__}: {e}")
+                result = {"trial": trial, **params, "status": "failed"}
+            writer.writerow(result)
+            f.flush()
+            results.append(result)
+            print(f"[INFO] trial {trial} {result['status']}: {params} "
+                  f"val_loss={result.get('val_loss', float('nan')):.4f}", flush=True)
+    print(f"[INFO] Results saved to: {results_path}")
+    return sorted(results, key=lambda r: (math.isnan(r.get("val_loss", math.nan)), r.get("val_loss", math.nan)))
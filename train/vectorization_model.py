@@ -1,65 +1,213 @@
+import hashlib
+import json
 import os
+from collections import Counter
+from dataclasses import replace
 
+import numpy as np
 import pandas as pd
-from keras import layers
 
 from poem.genre import Genre
+from poem.tokenizer import OOV_ID, OOV_TOKEN, Tokenizer, count_characters
+from train.config import Config
+from train.read_dataset import read_poem_text
 
 
-def save_vocabulary(vocabulary: list[str], genre: Genre):
+# Name of the shared-vocabulary model conditioned on the genre token, used in its file names
+MULTI_GENRE_NAME = "MULTI"
+
+
+def vocabulary_path(name: str) -> str:
+    return f'models/{name}_vocabulary.txt'
+
+
+def save_vocabulary(tokenizer: Tokenizer, name: str):
     os.makedirs('models', exist_ok=True)
-    vocab_path = f'models/{genre.name}_vocabulary.txt'
-    with open(vocab_path, 'w', encoding='utf-8') as f:
-        for token in vocabulary:
-            f.write(f"{token}\n")
+    vocab_path = vocabulary_path(name)
+    tokenizer.save(vocab_path)
     print(f"[INFO] Vocabulary saved to: {vocab_path}")
 
 
-def build_text_vectorization(poem_texts: pd.Series, poem_length: int):
-    # --- Build TextVectorization ---
-    text_vectorization = layers.TextVectorization(
-        standardize=None,
-        split='character',
-        output_mode="int",
-        output_sequence_length=poem_length
-    )
-    text_vectorization.adapt(poem_texts)
+# Vocabulary sizes (including padding and [UNK]) listed in the coverage report
+COVERAGE_REPORT_SIZES = (1000, 2000, 3000, 4000, 5000, 6000, 8000)
+
+
+def report_vocabulary_coverage(counts: Counter, tokenizer: Tokenizer):
+    """
+    Print the share of the corpus characters a vocabulary of each size covers, the rest being [UNK].
+    """
+    frequencies = np.array(sorted(counts.values(), reverse=True), dtype=np.int64)
+    cumulative = np.cumsum(frequencies)
+    total = int(cumulative[-1]) if len(cumulative) else 0
+    if not total:
+        return
+
+    def coverage(vocabulary_size: int) -> float:
+        covered = min(vocabulary_size - 2, len(cumulative))
+        return cumulative[covered - 1] / total if covered > 0 else 0.0
+
+    print(f'Distinct characters: {len(counts)}, characters in corpus: {total}')
+    print('Vocabulary size -> coverage:')
+    for size in [size for size in COVERAGE_REPORT_SIZES if size - 2 < len(counts)] + [len(counts) + 2]:
+        print(f'  {size:>6}  {coverage(size) * 100:7.3f}%')
+    kept = sum(counts[token] for token in tokenizer.get_vocabulary()[2:])
+    print(f'Kept {tokenizer.vocabulary_size - 2} of {len(counts)} characters, '
+          f'covering {kept / total * 100:.3f}% of the corpus; the rest are encoded as {OOV_TOKEN}')
+
 
-    print('Vocabulary size:', text_vectorization.vocabulary_size())
-    vocab_list = text_vectorization.get_vocabulary()
+def build_tokenizer(poem_texts: pd.Series, max_tokens: int = 0, min_count: int = 1,
+                    reserved_tokens=()) -> Tokenizer:
+    """
+    :param max_tokens: maximum vocabulary size including padding and [UNK] (0: no limit)
+    :param min_count: characters seen fewer times in the corpus are encoded as [UNK]
+    """
+    # --- Build Tokenizer ---
+    counts = count_characters(poem_texts)
+    tokenizer = Tokenizer.from_counts(counts, max_tokens, min_count, reserved_tokens)
+
+    print('Vocabulary size:', tokenizer.vocabulary_size)
+    vocab_list = tokenizer.get_vocabulary()
     print('Vocabulary samples:', ''.join(vocab_list[:20]))
+    report_vocabulary_coverage(counts, tokenizer)
 
     # Encode & decode a sample
-    encoded = text_vectorization(poem_texts.iloc[0])
-    decoded = [vocab_list[i] for i in encoded]
-    try:
-        enc_np = encoded.numpy()
-    except Exception:
-        # In case of Eager/Graph mode differences
-        enc_np = encoded
-    print('Encoded:', enc_np)
-    print('Decoded:', ''.join(decoded))
-
-    return text_vectorization
-
-
-def convert_to_tokens(poem_texts, genre: Genre):
-    # --- Build TextVectorization ---
-    poem_length = genre.length
-    text_vectorization = build_text_vectorization(poem_texts, poem_length)
-    vocab_list = text_vectorization.get_vocabulary()
-
-    # Encode all poems
-    train_token_ids = text_vectorization(poem_texts)
-    print('shape of train dataset:', train_token_ids.shape)
-
-    # Save vocabulary
-    save_vocabulary(vocab_list, genre)
-
-    # --- Prepare train/target sequences ---
-    train_sequences = train_token_ids[:, :-1]
-    target_sequences = train_token_ids[:, 1:]
+    encoded = tokenizer.encode(poem_texts.iloc[0])
+    print('Encoded:', encoded)
+    print('Decoded:', tokenizer.decode(encoded))
+
+    return tokenizer
+
+
+# ===== Tokenized corpus cache =====
+def token_cache_paths(name: str) -> tuple[str, str]:
+    """
+    The `.npy` token matrix, saved next to the vocabulary, and its JSON sidecar.
+    """
+    return f'models/{name}_tokens.npy', f'models/{name}_tokens.json'
+
+
+def _hash_texts(texts) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def token_dtype(vocabulary_size: int):
+    return np.int16 if vocabulary_size <= np.iinfo(np.int16).max + 1 else np.int32
+
+
+def load_cached_tokens(texts, name: str, length: int, corpus_hash: str,
+                       pruning: dict) -> tuple[np.ndarray, Tokenizer] | None:
+    """
+    Memory-map the token matrix saved for the same texts and vocabulary pruning, if any,
+    with the vocabulary it was encoded with.
+    """
+    tokens_path, sidecar_path = token_cache_paths(name)
+    vocab_path = vocabulary_path(name)
+    if not all(os.path.exists(path) for path in (tokens_path, sidecar_path, vocab_path)):
+        return None
+    with open(sidecar_path, "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+
+    tokenizer = Tokenizer.load(vocab_path)
+    if (sidecar.get("corpus_sha256") != corpus_hash
+            or sidecar.get("vocabulary_pruning", {"max_tokens": 0, "min_count": 1}) != pruning
+            or sidecar.get("vocabulary_sha256") != _hash_texts(tokenizer.get_vocabulary())):
+        return None
+    token_ids = np.load(tokens_path, mmap_mode="r")
+    if token_ids.shape != (len(texts), length):
+        return None
+    return token_ids, tokenizer
+
+
+def save_cached_tokens(token_ids: np.ndarray, tokenizer: Tokenizer, name: str, corpus_hash: str, pruning: dict):
+    tokens_path, sidecar_path = token_cache_paths(name)
+    os.makedirs('models', exist_ok=True)
+    np.save(tokens_path, token_ids)
+    # The sidecar is written last: it only exists for a complete token matrix
+    with open(sidecar_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "corpus_sha256": corpus_hash,
+            "vocabulary_pruning": pruning,
+            "vocabulary_sha256": _hash_texts(tokenizer.get_vocabulary()),
+            "shape": list(token_ids.shape),
+            "dtype": token_ids.dtype.name,
+        }, f, indent=2)
+    print(f"[INFO] Token ids cached to: {tokens_path}")
+
+
+def encode_corpus(texts: pd.Series, name: str, length: int, max_tokens: int = 0, min_count: int = 1,
+                  reserved_tokens=()) -> tuple[np.ndarray, Tokenizer]:
+    """
+    Encode the texts into a (texts, length) token matrix, padded with PADDING_ID.
+    See `build_tokenizer` for the vocabulary pruning options.
+
+    The matrix is cached as `.npy` next to the vocabulary and memory-mapped on later runs with
+    the same texts and pruning.
+    """
+    corpus_hash = _hash_texts(texts)
+    pruning = {"max_tokens": max_tokens, "min_count": min_count}
+    cached = load_cached_tokens(texts, name, length, corpus_hash, pruning)
+    if cached is not None:
+        token_ids, tokenizer = cached
+        print(f"[INFO] Loaded token ids from cache: {token_cache_paths(name)[0]}")
+    else:
+        # --- Build Tokenizer ---
+        tokenizer = build_tokenizer(texts, max_tokens, min_count, reserved_tokens)
+
+        # Encode all poems
+        encoded = tokenizer.encode_batch(texts, length, dtype=token_dtype(tokenizer.vocabulary_size))
+
+        # Save vocabulary
+        save_vocabulary(tokenizer, name)
+        print(f'Poems with {OOV_TOKEN}: {(encoded == OOV_ID).any(axis=1).mean() * 100:.2f}%')
+        save_cached_tokens(encoded, tokenizer, name, corpus_hash, pruning)
+        del encoded
+        token_ids = np.load(token_cache_paths(name)[0], mmap_mode="r")
+    print('shape of train dataset:', token_ids.shape, token_ids.dtype)
+    return token_ids, tokenizer
+
+
+def split_sequences(token_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # --- Prepare train/target sequences: zero-copy views into the same buffer ---
+    train_sequences = token_ids[:, :-1]
+    target_sequences = token_ids[:, 1:]
     print("[INFO] train_sequences.shape =", train_sequences.shape,
           " target_sequences.shape =", target_sequences.shape)
+    return train_sequences, target_sequences
+
+
+def convert_to_tokens(poem_texts, genre: Genre, max_tokens: int = 0, min_count: int = 1):
+    """
+    Encode the poems of one genre and return (train_sequences, target_sequences, tokenizer)
+    for next-token training. Train and target sequences are views into the same buffer, shifted by one.
+    """
+    token_ids, tokenizer = encode_corpus(poem_texts, genre.name, genre.length, max_tokens, min_count)
+    return *split_sequences(token_ids), tokenizer
+
+
+def convert_to_multi_genre_tokens(poems_by_genre: dict[Genre, pd.Series], max_tokens: int = 0, min_count: int = 1):
+    """
+    Encode the poems of all genres with one shared vocabulary, for a model conditioned on the genre.
+
+    Each poem is preceded by its genre token (`Genre.token`) and padded to the longest genre;
+    the padding targets are masked out during training. The genre tokens survive vocabulary pruning.
+    """
+    texts = pd.concat([genre.token + poems for genre, poems in poems_by_genre.items()], ignore_index=True)
+    length = 1 + max(genre.length for genre in poems_by_genre)
+    token_ids, tokenizer = encode_corpus(texts, MULTI_GENRE_NAME, length, max_tokens, min_count,
+                                         reserved_tokens=[genre.token for genre in poems_by_genre])
+    return *split_sequences(token_ids), tokenizer
+
 
-    return train_sequences, target_sequences, text_vectorization
+def prepare_training_tokens(config: Config):
+    """
+    Read, clean and encode the corpus of `config` (one genre, or all genres with `multi_genre`),
+    going through the corpus and token caches. Returns (train_sequences, target_sequences, tokenizer).
+    """
+    if config.multi_genre:
+        poems_by_genre = {genre: read_poem_text(replace(config, genre=genre)) for genre in Genre}
+        return convert_to_multi_genre_tokens(poems_by_genre, config.max_tokens, config.min_count)
+    return convert_to_tokens(read_poem_text(config), config.genre, config.max_tokens, config.min_count)